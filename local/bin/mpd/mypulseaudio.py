@@ -3,37 +3,217 @@ import subprocess
 import json
 import time
 import html
+import os
+import re
+import socket
 from pathlib import Path
 
+import dbus
+from dbus.mainloop.glib import DBusGMainLoop
+from gi.repository import GLib
+
 CACHE_FILE = Path.home() / ".cache" / "nowplaying_scroll.json"
-SLEEP = 1
-SCROLL_SPEED = 1
+FPS = 4  # how often the marquee is redrawn
+SCROLL_SPEED = 1  # characters per second the text moves
 SEP = "  "
 EXCLUDED = {"JBL_Go_4"}
 DIV = 4
 MIN_LEN = 6
 MAX_LEN = 12
+MPRIS_PREFIX = "org.mpris.MediaPlayer2."
+MPRIS_PATH = "/org/mpris/MediaPlayer2"
+PLAYER_IFACE = "org.mpris.MediaPlayer2.Player"
+PROPERTIES_IFACE = "org.freedesktop.DBus.Properties"
+# playerctld re-exports whichever player is active, and mpd-mpris/mpDris2
+# bridge MPD, which MpdWatcher already follows; both would show up twice.
+PROXIES = {"playerctld", "mpd"}
+MPD_HOST = os.environ.get("MPD_HOST", "127.0.0.1")
+MPD_PORT = int(os.environ.get("MPD_PORT", "6600"))
+MPD_TIMEOUT = 2
+MPD_RECONNECT = 5
+MPD_STATES = {"play": "Playing", "pause": "Paused", "stop": "Stopped"}
+# Anchored so sink-input (stream) events don't read as sink events.
+PACTL_EVENT = re.compile(r"^Event '(\w+)' on (sink|server)(?: #(\d+))?$")
+SWITCH_EVENTS = {("server", "change"), ("sink", "new"), ("sink", "remove")}
+RESUBSCRIBE_DELAY = 2
 
 
-def run(cmd):
-    return subprocess.run(
-        ["playerctl"] + cmd, capture_output=True, text=True
-    ).stdout.strip()
+def track_text(artists, title) -> str:
+    artist = ", ".join(artists)
+    return f"{artist} – {title}" if artist else title
+
+
+def format_track(metadata) -> str:
+    artists = [str(a) for a in metadata.get("xesam:artist", [])]
+    return track_text(artists, str(metadata.get("xesam:title", "")))
+
+
+class MprisWatcher:
+    # Mirrors each MPRIS player's status and track from session bus signals,
+    # so nothing is spawned or queried while the players are idle.
+    def __init__(self, bus, on_change):
+        self.bus = bus
+        self.on_change = on_change
+        self.players = {}  # unique bus name -> {"name", "status", "track"}
+        bus.add_signal_receiver(
+            self.owner_changed,
+            signal_name="NameOwnerChanged",
+            dbus_interface="org.freedesktop.DBus",
+            bus_name="org.freedesktop.DBus",
+        )
+        bus.add_signal_receiver(
+            self.properties_changed,
+            signal_name="PropertiesChanged",
+            dbus_interface=PROPERTIES_IFACE,
+            path=MPRIS_PATH,
+            sender_keyword="sender",
+        )
+        for name in bus.list_names():
+            if name.startswith(MPRIS_PREFIX):
+                self.add_player(str(name), str(bus.get_name_owner(name)))
+
+    def properties(self, owner):
+        return dbus.Interface(
+            self.bus.get_object(owner, MPRIS_PATH, introspect=False),
+            PROPERTIES_IFACE,
+        )
+
+    def add_player(self, name, owner):
+        short = name.removeprefix(MPRIS_PREFIX)
+        if short in EXCLUDED or short in PROXIES:
+            return
+        try:
+            props = self.properties(owner).GetAll(PLAYER_IFACE)
+        except dbus.DBusException:
+            return
+        self.players[owner] = {
+            "name": short,
+            "status": str(props.get("PlaybackStatus", "Stopped")),
+            "track": format_track(props.get("Metadata", {})),
+        }
+
+    def owner_changed(self, name, old_owner, new_owner):
+        if not name.startswith(MPRIS_PREFIX):
+            return
+        self.players.pop(str(old_owner), None)
+        if new_owner:
+            self.add_player(str(name), str(new_owner))
+        self.on_change()
+
+    def properties_changed(self, interface, changed, invalidated, sender=None):
+        player = self.players.get(sender)
+        if interface != PLAYER_IFACE or player is None:
+            return
+        # Some players only invalidate a property; fetch just that one then.
+        for prop in {"PlaybackStatus", "Metadata"} & set(invalidated):
+            try:
+                changed[prop] = self.properties(sender).Get(PLAYER_IFACE, prop)
+            except dbus.DBusException:
+                pass
+        if "PlaybackStatus" in changed:
+            player["status"] = str(changed["PlaybackStatus"])
+        if "Metadata" in changed:
+            player["track"] = format_track(changed["Metadata"])
+        self.on_change()
+
+    def active_player(self):
+        return next(
+            (p for p in self.players.values() if p["status"] == "Playing"), None
+        )
+
+
+class MpdWatcher:
+    # Talks to MPD directly. `idle player mixer` parks the connection until
+    # the song, play state or volume changes, so nothing is polled; each
+    # wakeup fetches status and currentsong in one command list.
+    def __init__(self, on_change, host=MPD_HOST, port=MPD_PORT):
+        self.on_change = on_change
+        self.host = host
+        self.port = port
+        self.sock = None
+        self.file = None
+        self.player = None  # {"name", "status", "track", "volume"}
+        GLib.idle_add(self.connect)
+
+    def connect(self):
+        try:
+            if self.host.startswith("/"):
+                self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self.sock.settimeout(MPD_TIMEOUT)
+                self.sock.connect(self.host)
+            else:
+                self.sock = socket.create_connection(
+                    (self.host, self.port), timeout=MPD_TIMEOUT
+                )
+            self.file = self.sock.makefile("rb")
+            if not self.file.readline().startswith(b"OK MPD "):
+                raise OSError("not an MPD server")
+            self.fetch()
+            self.sock.sendall(b"idle player mixer\n")
+        except OSError:
+            self.disconnect()
+            return False
+        GLib.io_add_watch(
+            self.sock.fileno(), GLib.IO_IN | GLib.IO_HUP | GLib.IO_ERR, self.on_idle
+        )
+        self.on_change()
+        return False  # also runs as a one-shot GLib callback
+
+    def disconnect(self):
+        if self.file:
+            self.file.close()
+        if self.sock:
+            self.sock.close()
+        self.sock = self.file = self.player = None
+        GLib.timeout_add_seconds(MPD_RECONNECT, self.connect)
 
+    def read_response(self):
+        pairs = []
+        while True:
+            line = self.file.readline()
+            if not line:
+                raise OSError("MPD closed the connection")
+            line = line.decode(errors="replace").rstrip("\n")
+            if line == "OK":
+                return pairs
+            if line.startswith("ACK "):
+                raise OSError(line)
+            key, _, value = line.partition(": ")
+            pairs.append((key, value))
 
-def get_players():
-    return [p for p in run(["-l"]).splitlines() if p != "No players found"]
+    def fetch(self):
+        self.sock.sendall(
+            b"command_list_begin\nstatus\ncurrentsong\ncommand_list_end\n"
+        )
+        pairs = self.read_response()
+        fields = dict(pairs)
+        title = fields.get("Title") or os.path.basename(fields.get("file", ""))
+        self.player = {
+            "name": "mpd",
+            "status": MPD_STATES.get(fields.get("state"), "Stopped"),
+            "track": track_text([v for k, v in pairs if k == "Artist"], title),
+            # -1 when MPD has no mixer
+            "volume": int(fields.get("volume", -1)),
+        }
 
+    def on_idle(self, fd, condition):
+        before = self.player
+        try:
+            self.read_response()  # changed: player / changed: mixer
+            self.fetch()
+            self.sock.sendall(b"idle player mixer\n")
+        except OSError:
+            self.disconnect()
+            self.on_change()
+            return False
+        if self.player != before:
+            self.on_change()
+        return True
 
-def get_active_player():
-    players = get_players()
-    for p in players:
-        if p in EXCLUDED:
-            continue
-        status = run(["--player", p, "status"])
-        if status == "Playing":
-            return p
-    return None
+    def active_player(self):
+        if self.player and self.player["status"] == "Playing":
+            return self.player
+        return None
 
 
 def window_len(text_len):
@@ -42,91 +222,201 @@ def window_len(text_len):
     return max(MIN_LEN, length)
 
 
-def get_metadata(player):
-    artist = run(["--player", player, "metadata", "xesam:artist"])
-    title = run(["--player", player, "metadata", "xesam:title"])
-    return f"{artist} – {title}" if artist else title
+class Marquee:
+    # Holds the escaped scroll frames for the current track. The frame shown
+    # follows from when the track started, so only a track change is written
+    # to disk and a restart resumes where the text was.
+    def __init__(self, path=CACHE_FILE):
+        self.path = path
+        self.track = None
+        self.frames = [""]
+        self.started = 0.0
+        try:
+            data = json.loads(path.read_text())
+            self.saved = (data["track"], float(data["started"]))
+        except (OSError, ValueError, KeyError, TypeError):
+            self.saved = (None, 0.0)
+
+    @property
+    def scrolling(self) -> bool:
+        return len(self.frames) > 1
+
+    def load(self, track, now):
+        self.track = track
+        win = window_len(len(track))
+        if len(track) <= win:
+            self.frames = [html.escape(track[:win])]
+        else:
+            cycle = track + SEP
+            looped = cycle * 2
+            self.frames = [
+                html.escape(looped[start : start + win]) for start in range(len(cycle))
+            ]
+        saved_track, saved_started = self.saved
+        if track == saved_track:
+            self.started = saved_started
+            return
+        self.started = now
+        self.saved = (track, now)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json.dumps({"track": track, "started": now}))
+
+    def frame(self, track, now) -> str:
+        if track != self.track:
+            self.load(track, now)
+        index = int((now - self.started) * SCROLL_SPEED) % len(self.frames)
+        return self.frames[index]
 
 
-def load_state():
-    if CACHE_FILE.exists():
-        data = json.loads(CACHE_FILE.read_text())
-        return (
-            data.get("track"),
-            float(data.get("pos", 0)),
-            data.get("ts", time.time()),
+def pactl(*args):
+    return subprocess.run(
+        ["pactl", *args], capture_output=True, text=True, check=False
+    ).stdout
+
+
+class VolumeWatcher:
+    # Follows one long-lived `pactl subscribe` stream and re-reads the
+    # default sink only when an event says it changed.
+    def __init__(self, on_change):
+        self.on_change = on_change
+        self.volume = 0
+        self.muted = False
+        self.default_index = None
+        self.buffer = b""
+        self.refresh_default()
+        self.query()
+        self.subscribe()
+
+    def subscribe(self):
+        self.proc = subprocess.Popen(
+            ["pactl", "subscribe"], stdout=subprocess.PIPE, stdin=subprocess.DEVNULL
+        )
+        GLib.io_add_watch(
+            self.proc.stdout.fileno(), GLib.IO_IN | GLib.IO_HUP, self.on_events
         )
-    return None, 0.0, time.time()
 
+    def resubscribe(self):
+        # The restarted server numbers its sinks afresh and the volume may
+        # have changed while nothing was listening, so read both again.
+        self.subscribe()
+        self.refresh_default()
+        before = (self.volume, self.muted)
+        self.query()
+        if (self.volume, self.muted) != before:
+            self.on_change()
+        return False  # runs as a one-shot GLib timeout
 
-def save_state(track, pos):
-    CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
-    CACHE_FILE.write_text(json.dumps({"track": track, "pos": pos, "ts": time.time()}))
+    def refresh_default(self):
+        name = pactl("get-default-sink").strip()
+        self.default_index = next(
+            (
+                fields[0]
+                for fields in map(
+                    str.split, pactl("list", "short", "sinks").splitlines()
+                )
+                if len(fields) > 1 and fields[1] == name
+            ),
+            None,
+        )
+
+    def query(self):
+        vols = [
+            int(x)
+            for x in re.findall(r"(\d+)%", pactl("get-sink-volume", "@DEFAULT_SINK@"))
+        ]
+        self.volume = sum(vols[:2]) // len(vols[:2]) if vols else 0
+        self.muted = pactl("get-sink-mute", "@DEFAULT_SINK@").strip().endswith("yes")
 
+    def on_events(self, fd, condition):
+        data = os.read(fd, 65536)
+        if not data:
+            # pactl exited (audio server restart); subscribe again shortly.
+            self.proc.stdout.close()
+            self.proc.wait()
+            self.buffer = b""
+            GLib.timeout_add_seconds(RESUBSCRIBE_DELAY, self.resubscribe)
+            return False
+        *lines, self.buffer = (self.buffer + data).split(b"\n")
+        # A volume scroll emits a burst of events; handle it with one query.
+        default_switched = sink_changed = False
+        for line in lines:
+            match = PACTL_EVENT.match(line.decode(errors="replace").strip())
+            if not match:
+                continue
+            kind, facility, index = match.groups()
+            # A default sink switch shows up as a server change; a sink
+            # coming or going may take the default with it.
+            if (facility, kind) in SWITCH_EVENTS:
+                default_switched = True
+            elif facility == "sink" and index == self.default_index:
+                sink_changed = True
+        if default_switched:
+            self.refresh_default()
+        if default_switched or sink_changed:
+            before = (self.volume, self.muted)
+            self.query()
+            if (self.volume, self.muted) != before:
+                self.on_change()
+        return True
 
-def scroll_text(text, pos, delta):
-    text_len = len(text)
-    win = window_len(text_len)
-    if text_len <= win:
-        return 0.0, text[:win]
-    cycle = text + SEP
-    cycle_len = len(cycle)
-    looped = cycle * 2
-    pos = pos + delta * SCROLL_SPEED
-    if pos >= cycle_len:
-        pos -= cycle_len
-    start = int(pos)
-    return pos, looped[start : start + win]
 
+def volume_icon(vol, muted=False):
+    return "󰖁" if muted or vol == 0 else "󰕿" if vol <= 33 else "󰖀" if vol <= 66 else "󰕾"
 
-def get_volume():
-    out = subprocess.check_output(
-        ["pactl", "get-sink-volume", "@DEFAULT_SINK@"], text=True
-    )
-    vols = [int(x) for x in __import__("re").findall(r"(\d+)%", out)]
-    return sum(vols[:2]) // len(vols[:2]) if vols else 0
 
+def volume_label(vol, muted):
+    return f"{vol}% (muted)" if muted else f"{vol}%"
 
-def volume_icon(vol):
-    return "󰖁" if vol == 0 else "󰕿" if vol <= 33 else "󰖀" if vol <= 66 else "󰕾"
+
+def render(player, volume, muted, marquee):
+    if not player:
+        return {
+            "text": volume_icon(volume, muted),
+            "tooltip": volume_label(volume, muted),
+            "class": "stopped",
+        }
+    track = player["track"]
+    safe_display = marquee.frame(track, time.time())
+    text = f"{volume_icon(volume, muted)}<span size='4pt'> </span><span size='9pt'>{safe_display}</span>"
+    safe_track = html.escape(track)
+    tooltip = f"{volume_label(volume, muted)}\n{safe_track}"
+    if player.get("volume", -1) >= 0:
+        tooltip += f"\nmpd {player['volume']}%"
+    return {"text": text, "tooltip": tooltip, "class": "playing"}
 
 
 def main():
-    pos = 0.0
-    while True:
-        player = get_active_player()
-        volume = get_volume()
-        if not player:
-            output = {
-                "text": volume_icon(volume),
-                "tooltip": f"{volume}%",
-                "class": "stopped",
-            }
-            print(json.dumps(output, ensure_ascii=False), flush=True)
-            time.sleep(SLEEP)
-            continue
-        track = get_metadata(player)
-        now = time.time()
-        saved_track, saved_pos, saved_ts = load_state()
-        if track != saved_track:
-            pos = 0.0
-            win = window_len(len(track))
-            display = track[:win]
-        else:
-            pos, display = scroll_text(track, saved_pos, now - saved_ts)
-        save_state(track, pos)
-        safe_display = html.escape(display)
-        text = f"{volume_icon(volume)}<span size='4pt'> </span><span size='9pt'>{safe_display}</span>"
-        safe_track = html.escape(track)
-        tooltip = f"{volume}%\n{safe_track}"
-        print(
-            json.dumps(
-                {"text": text, "tooltip": tooltip, "class": "playing"},
-                ensure_ascii=False,
-            ),
-            flush=True,
-        )
-        time.sleep(SLEEP)
+    DBusGMainLoop(set_as_default=True)
+    marquee = Marquee()
+    last_output = None
+    ticking = False
+
+    def refresh():
+        nonlocal last_output, ticking
+        player = mpd.active_player() or watcher.active_player()
+        output = render(player, volume.volume, volume.muted, marquee)
+        output_json = json.dumps(output, ensure_ascii=False)
+        if output_json != last_output:
+            print(output_json, flush=True)
+            last_output = output_json
+        scrolling = player is not None and marquee.scrolling
+        if scrolling and not ticking:
+            ticking = True
+            GLib.timeout_add(1000 // FPS, tick)
+        return scrolling
+
+    def tick():
+        nonlocal ticking
+        ticking = refresh()
+        return ticking  # False disarms the timeout once nothing scrolls
+
+    # Player and volume changes arrive as events and render straight away;
+    # the timeout only runs while the marquee has frames to advance.
+    watcher = MprisWatcher(dbus.SessionBus(), on_change=refresh)
+    volume = VolumeWatcher(on_change=refresh)
+    mpd = MpdWatcher(on_change=refresh)
+    refresh()
+    GLib.MainLoop().run()
 
 
 if __name__ == "__main__":
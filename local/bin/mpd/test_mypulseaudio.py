@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# MpdWatcher against a scripted MPD server on a local socket. The watcher
+# only needs a socket; GLib is swapped for a recorder so each callback it
+# would have scheduled is run by hand.
+import os
+import queue
+import socket
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import mypulseaudio
+
+
+class RecordingGLib:
+    IO_IN = 1
+    IO_ERR = 8
+    IO_HUP = 16
+
+    def __init__(self):
+        self.idles = []
+        self.timeouts = []
+        self.watches = []
+
+    def idle_add(self, callback):
+        self.idles.append(callback)
+
+    def timeout_add_seconds(self, seconds, callback):
+        self.timeouts.append(callback)
+
+    def io_add_watch(self, fd, condition, callback):
+        self.watches.append((fd, callback))
+
+
+class FakeMpd:
+    # Answers status/currentsong from `state` and parks each `idle` until a
+    # subsystem name, "ACK" or "close" is pushed onto `events`.
+    def __init__(self, greeting=b"OK MPD 0.23.5\n"):
+        self.greeting = greeting
+        self.state = {"state": "play", "volume": "40"}
+        self.song = [("file", "music/a.flac"), ("Artist", "A"), ("Title", "Song")]
+        self.events = queue.Queue()
+        self.commands = []
+        self.server = socket.create_server(("127.0.0.1", 0))
+        self.port = self.server.getsockname()[1]
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    def accept(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.serve, args=(conn,), daemon=True).start()
+
+    def serve(self, conn):
+        with conn, conn.makefile("rwb", buffering=0) as f:
+            f.write(self.greeting)
+            batch = None
+            for line in f:
+                command = line.decode().strip()
+                self.commands.append(command)
+                if command == "command_list_begin":
+                    batch = []
+                elif command == "command_list_end":
+                    f.write(b"".join(self.reply(c) for c in batch) + b"OK\n")
+                    batch = None
+                elif batch is not None:
+                    batch.append(command)
+                elif command.startswith("idle"):
+                    event = self.events.get()
+                    if event == "close":
+                        return
+                    if event == "ACK":
+                        f.write(b"ACK [5@0] {idle} unknown command\n")
+                    else:
+                        f.write(f"changed: {event}\nOK\n".encode())
+                else:
+                    f.write(b"OK\n")
+
+    def reply(self, command) -> bytes:
+        if command == "status":
+            pairs = self.state.items()
+        elif command == "currentsong":
+            pairs = self.song
+        else:
+            pairs = []
+        return "".join(f"{key}: {value}\n" for key, value in pairs).encode()
+
+    def wait_for(self, count, timeout=2):
+        # The watcher sends `idle` after it has its reply, so give the
+        # server thread a moment to log it.
+        deadline = time.monotonic() + timeout
+        while len(self.commands) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self.commands
+
+    def close(self):
+        self.server.close()
+        self.events.put("close")
+
+
+FETCH = ["command_list_begin", "status", "currentsong", "command_list_end"]
+IDLE = "idle player mixer"
+
+
+class MpdWatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.glib = RecordingGLib()
+        patcher = mock.patch.object(mypulseaudio, "GLib", self.glib)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.changes = 0
+
+    def on_change(self):
+        self.changes += 1
+
+    def start(self, server):
+        self.addCleanup(server.close)
+        watcher = mypulseaudio.MpdWatcher(self.on_change, port=server.port)
+        self.addCleanup(lambda: watcher.sock and watcher.sock.close())
+        # The first connect is deferred to the main loop.
+        self.assertFalse(self.glib.idles.pop()())
+        return watcher
+
+    def idle(self, watcher, server, event):
+        server.events.put(event)
+        fd, callback = self.glib.watches[-1]
+        return callback(fd, self.glib.IO_IN)
+
+    def test_greeting_then_command_list_and_idle(self):
+        server = FakeMpd()
+        watcher = self.start(server)
+        self.assertEqual(server.wait_for(5), [*FETCH, IDLE])
+        self.assertEqual(self.changes, 1)
+        self.assertEqual(
+            watcher.player,
+            {"name": "mpd", "status": "Playing", "track": "A – Song", "volume": 40},
+        )
+        self.assertIs(watcher.active_player(), watcher.player)
+        self.assertEqual(len(self.glib.watches), 1)
+
+    def test_changed_refetches_and_reidles(self):
+        server = FakeMpd()
+        watcher = self.start(server)
+        server.state["state"] = "pause"
+        self.assertTrue(self.idle(watcher, server, "player"))
+        self.assertEqual(server.wait_for(10), [*FETCH, IDLE] * 2)
+        self.assertEqual(self.changes, 2)
+        self.assertEqual(watcher.player["status"], "Paused")
+        self.assertIsNone(watcher.active_player())
+
+    def test_unchanged_mixer_event_does_not_notify(self):
+        server = FakeMpd()
+        watcher = self.start(server)
+        self.assertTrue(self.idle(watcher, server, "mixer"))
+        self.assertEqual(self.changes, 1)
+        self.assertEqual(watcher.player["volume"], 40)
+
+    def test_title_falls_back_to_file_name(self):
+        server = FakeMpd()
+        server.song = [("file", "music/b.flac"), ("Artist", "X"), ("Artist", "Y")]
+        watcher = self.start(server)
+        self.assertEqual(watcher.player["track"], "X, Y – b.flac")
+
+    def test_ack_is_an_error(self):
+        server = FakeMpd()
+        watcher = self.start(server)
+        server.events.put("ACK")
+        with self.assertRaisesRegex(OSError, r"^ACK \[5@0\] \{idle\}"):
+            watcher.read_response()
+
+    def test_ack_drops_the_connection(self):
+        server = FakeMpd()
+        watcher = self.start(server)
+        self.assertFalse(self.idle(watcher, server, "ACK"))
+        self.assertIsNone(watcher.player)
+        self.assertIsNone(watcher.sock)
+        self.assertEqual(self.changes, 2)
+        self.assertEqual(self.glib.timeouts, [watcher.connect])
+
+    def test_reconnects_after_disconnect(self):
+        server = FakeMpd()
+        watcher = self.start(server)
+        self.assertFalse(self.idle(watcher, server, "close"))
+        self.assertIsNone(watcher.player)
+        self.assertEqual(self.changes, 2)
+        # The retry timer reconnects to the same, still listening, server.
+        self.assertFalse(self.glib.timeouts.pop()())
+        self.assertEqual(server.wait_for(10), [*FETCH, IDLE] * 2)
+        self.assertEqual(watcher.player["status"], "Playing")
+        self.assertEqual(self.changes, 3)
+        self.assertEqual(len(self.glib.watches), 2)
+
+    def test_not_an_mpd_server(self):
+        server = FakeMpd(greeting=b"SSH-2.0-OpenSSH_9.9\n")
+        watcher = self.start(server)
+        self.assertIsNone(watcher.player)
+        self.assertEqual(self.changes, 0)
+        self.assertEqual(self.glib.timeouts, [watcher.connect])
+
+    def test_server_down_schedules_a_retry(self):
+        server = FakeMpd()
+        server.server.close()
+        watcher = self.start(server)
+        self.assertIsNone(watcher.player)
+        self.assertEqual(self.glib.watches, [])
+        self.assertEqual(self.glib.timeouts, [watcher.connect])
+
+
+class VolumeWatcherTest(unittest.TestCase):
+    # on_events against `pactl subscribe` lines written to a pipe, counting
+    # the pactl calls they lead to instead of making them.
+    def setUp(self):
+        self.glib = RecordingGLib()
+        patcher = mock.patch.object(mypulseaudio, "GLib", self.glib)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.watcher = mypulseaudio.VolumeWatcher.__new__(mypulseaudio.VolumeWatcher)
+        self.watcher.buffer = b""
+        self.watcher.default_index = "5"
+        self.watcher.volume, self.watcher.muted = 40, False
+        self.watcher.on_change = mock.Mock()
+        self.watcher.refresh_default = mock.Mock()
+        self.watcher.query = mock.Mock()
+
+    def feed(self, *lines):
+        read, write = os.pipe()
+        self.addCleanup(os.close, read)
+        with os.fdopen(write, "wb") as f:
+            f.write("".join(f"{line}\n" for line in lines).encode())
+        self.assertTrue(self.watcher.on_events(read, mypulseaudio.GLib.IO_IN))
+
+    def test_stream_events_are_ignored(self):
+        self.feed(
+            "Event 'new' on sink-input #12",
+            "Event 'change' on sink-input #12",
+            "Event 'remove' on sink-input #12",
+            "Event 'new' on source-output #3",
+        )
+        self.watcher.refresh_default.assert_not_called()
+        self.watcher.query.assert_not_called()
+
+    def test_default_sink_change_queries_once(self):
+        self.feed("Event 'change' on sink #5", "Event 'change' on sink #5")
+        self.watcher.refresh_default.assert_not_called()
+        self.watcher.query.assert_called_once()
+
+    def test_other_sink_change_is_ignored(self):
+        self.feed("Event 'change' on sink #6")
+        self.watcher.query.assert_not_called()
+
+    def test_switch_events(self):
+        for line in (
+            "Event 'change' on server",
+            "Event 'new' on sink #7",
+            "Event 'remove' on sink #5",
+        ):
+            self.watcher.refresh_default.reset_mock()
+            self.watcher.query.reset_mock()
+            self.feed(line)
+            self.watcher.refresh_default.assert_called_once()
+            self.watcher.query.assert_called_once()
+
+    def test_resubscribe_rereads_default_sink(self):
+        # pactl exits when the audio server restarts; the new server numbers
+        # its sinks afresh.
+        self.watcher.proc = proc = mock.Mock()
+        read, write = os.pipe()
+        os.close(write)
+        self.addCleanup(os.close, read)
+        self.assertFalse(self.watcher.on_events(read, self.glib.IO_HUP))
+        proc.stdout.close.assert_called_once()
+        proc.wait.assert_called_once()
+        self.assertEqual(self.glib.timeouts, [self.watcher.resubscribe])
+
+        def refresh_default():
+            self.watcher.default_index = "9"
+
+        def query():
+            self.watcher.volume = 55
+
+        self.watcher.refresh_default.side_effect = refresh_default
+        self.watcher.query.side_effect = query
+        with mock.patch.object(mypulseaudio.subprocess, "Popen") as popen:
+            popen.return_value.stdout.fileno.return_value = 99
+            self.assertFalse(self.glib.timeouts.pop()())
+        self.assertEqual(self.glib.watches, [(99, self.watcher.on_events)])
+        self.watcher.on_change.assert_called_once()
+
+        self.watcher.query.reset_mock()
+        self.feed("Event 'change' on sink #9")
+        self.watcher.query.assert_called_once()
+
+
+class MarqueeTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.marquee = mypulseaudio.Marquee(Path(tmp.name) / "scroll.json")
+
+    def test_scrolls_at_scroll_speed_whatever_the_fps(self):
+        track = "Artist – A Title Long Enough To Scroll"
+        first = self.marquee.frame(track, 100.0)
+        self.assertTrue(self.marquee.scrolling)
+        # Redraws between whole seconds show the same frame.
+        for now in (100.25, 100.5, 100.75):
+            self.assertEqual(self.marquee.frame(track, now), first)
+        self.assertEqual(self.marquee.frame(track, 101.0), self.marquee.frames[1])
+        self.assertEqual(self.marquee.frame(track, 103.5), self.marquee.frames[3])
+
+    def test_resumes_from_the_saved_start(self):
+        track = "Artist – A Title Long Enough To Scroll"
+        self.marquee.frame(track, 100.0)
+        restarted = mypulseaudio.Marquee(self.marquee.path)
+        self.assertEqual(restarted.frame(track, 105.0), self.marquee.frames[5])
+
+
+if __name__ == "__main__":
+    unittest.main()
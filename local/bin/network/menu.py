@@ -1,93 +1,235 @@
 #!/usr/bin/env python3
-import time
+import json
 import subprocess
 import sys
+import time
 import dbus
+import dbus.service
+from dbus.mainloop.glib import DBusGMainLoop
+from gi.repository import GLib
 from pathlib import Path
 
+from netstate import wireguard_links
+
 HOME = Path.home()
 FUZZEL_CONFIG = HOME / ".config/fuzzel/netmenu.ini"
-SLEEP_TIME = 2
+CACHE = HOME / ".cache/netmenu.json"
+SCAN_TIMEOUT = 15
 MAIN_CHOICES = ["WiFi", "VPN", "Cancel"]
+IWD = "net.connman.iwd"
+STATION = f"{IWD}.Station"
+NETWORK = f"{IWD}.Network"
+KNOWN_NETWORK = f"{IWD}.KnownNetwork"
+AGENT = f"{IWD}.Agent"
+AGENT_PATH = "/polka/netmenu/agent"
+# Takes the link to bring up ("" for none) followed by the links to take
+# down, so a whole switch is one sudo call that sudoers can allowlist. Only
+# a root-owned copy is safe to allowlist; the one next to this file is the
+# fallback that still asks for a password.
+WG_SWITCH = Path("/usr/local/bin/wg-switch")
+if not WG_SWITCH.exists():
+    WG_SWITCH = Path(__file__).resolve().parent / "wg-switch"
+PROPERTIES = "org.freedesktop.DBus.Properties"
+SECURED = {"psk", "wep"}
+# iwctl's thresholds for its four signal stars, in 100 * dBm.
+STRENGTH_ICONS = [(-6000, "󰤨"), (-6700, "󰤥"), (-7500, "󰤟")]
+WEAKEST_ICON = "󰤯"
+
+
+class AgentCanceled(dbus.DBusException):
+    _dbus_error_name = f"{IWD}.Agent.Error.Canceled"
+
+
+class PassphraseAgent(dbus.service.Object):
+    # iwd calls back into this when a network it has no credentials for is
+    # being connected; known networks never reach it.
+    def __init__(self, bus, names):
+        super().__init__(bus, AGENT_PATH)
+        self.names = names  # network object path -> SSID
+
+    @dbus.service.method(AGENT, in_signature="", out_signature="")
+    def Release(self):
+        pass
+
+    @dbus.service.method(AGENT, in_signature="o", out_signature="s")
+    def RequestPassphrase(self, path):
+        password = get_wifi_password_via_zenity(self.names.get(path, str(path)))
+        if not password:
+            raise AgentCanceled("No passphrase given")
+        return password
+
+    @dbus.service.method(AGENT, in_signature="s", out_signature="")
+    def Cancel(self, reason):
+        pass
 
 
 class NetworkManager:
     def __init__(self):
+        # A main loop lets scans, fuzzel and the agent run side by side.
+        DBusGMainLoop(set_as_default=True)
         self.bus = dbus.SystemBus()
         self.manager = dbus.Interface(
-            self.bus.get_object("net.connman.iwd", "/"),
+            self.bus.get_object(IWD, "/"),
             "org.freedesktop.DBus.ObjectManager",
         )
-        self.device_name = "wlan0"
+        self.loop = GLib.MainLoop()
+        self.scan_match = None
+        self.agent = None
 
-    def _run_command(self, command: list[str]) -> str:
-        result = subprocess.run(["iwctl"] + command, capture_output=True, text=True)
-        if result.returncode != 0:
-            raise Exception(f"Error executing command: {result.stderr}")
-        return result.stdout
+    def wait(self, done, timeout=None):
+        # Runs the main loop until done() holds; callbacks quit the loop so
+        # the condition is checked again.
+        expired = []
+        if timeout:
+            timer = GLib.timeout_add_seconds(
+                timeout, lambda: expired.append(True) or self.loop.quit()
+            )
+        while not done() and not expired:
+            self.loop.run()
+        if timeout and not expired:
+            GLib.source_remove(timer)
+
+    def wait_for_close(self, stream):
+        closed = []
+        GLib.io_add_watch(
+            stream.fileno(),
+            GLib.IO_HUP | GLib.IO_ERR,
+            lambda *args: closed.append(True) or self.loop.quit(),
+        )
+        self.wait(lambda: closed)
 
     def find_device(self):
+        self.objects = self.manager.GetManagedObjects()
         device_path = next(
             (
                 path
-                for path, interfaces in self.manager.GetManagedObjects().items()
-                if "net.connman.iwd.Station" in interfaces
+                for path, interfaces in self.objects.items()
+                if STATION in interfaces
             ),
             None,
         )
         if not device_path:
             raise Exception("No devices found")
         self.device_path = device_path
+        self.station = dbus.Interface(
+            self.bus.get_object(IWD, self.device_path), STATION
+        )
 
-    def scan_networks(self, sleep_time: int):
-        device = dbus.Interface(
-            self.bus.get_object("net.connman.iwd", self.device_path),
-            "net.connman.iwd.Station",
+    def start_scan(self):
+        # Starts a scan without blocking; when iwd reports it done, the
+        # results are written to the cache.
+        if self.scan_match:
+            return
+        self.scan_match = self.bus.add_signal_receiver(
+            self.scan_changed,
+            signal_name="PropertiesChanged",
+            dbus_interface=PROPERTIES,
+            bus_name=IWD,
+            path=self.device_path,
         )
-        device.Scan()
-        time.sleep(sleep_time)
+        self.station.Scan(reply_handler=lambda: None, error_handler=self.scan_failed)
+
+    def scan_changed(self, interface, props, invalidated):
+        if interface == STATION and not props.get("Scanning", True):
+            self.scan_finished()
 
-    def get_networks(self) -> str:
-        return self._run_command(["station", self.device_name, "get-networks"])
+    def scan_failed(self, error):
+        # Usually a scan already in progress; its end is signalled as well.
+        if not self.station.Get(STATION, "Scanning", dbus_interface=PROPERTIES):
+            self.scan_finished()
 
-    def filter_valid_networks(self, networks_raw: str) -> list[tuple[str, str]]:
+    def scan_finished(self):
+        if not self.scan_match:
+            return
+        self.scan_match.remove()
+        self.scan_match = None
+        self.find_device()
+        self.save_cache()
+        self.loop.quit()
+
+    def scan_networks(self, timeout: int = SCAN_TIMEOUT):
+        self.start_scan()
+        self.wait(lambda: self.scan_match is None, timeout)
+
+    def get_networks(self) -> list[tuple[str, int]]:
+        # Strongest first, as (SSID, signal in 100 * dBm); the network names
+        # come from the objects find_device() already fetched.
         networks = []
-        for line in networks_raw.splitlines():
-            line = line.strip()
-            if "psk" in line or "WEP" in line:
-                parts = line.split()
-                if parts:
-                    if parts[0] == "\x1b[0m":
-                        if parts[1] == "\x1b[1;90m>":
-                            print("current")
-                            networks.append((parts[3], parts[5]))
-                        else:
-                            networks.append((parts[1], parts[3]))
-                    else:
-                        networks.append((parts[0], parts[2]))
+        for path, strength in self.station.GetOrderedNetworks():
+            props = self.objects.get(path, {}).get(NETWORK)
+            if props and props["Type"] in SECURED:
+                networks.append((str(props["Name"]), int(strength)))
         return networks
 
-    def connect_to_network(self, ssid: str, password: str):
-        command = ["station", self.device_name, "connect", ssid]
-        if password:
-            command.extend(["--passphrase", password])
-        self._run_command(command)
+    def known_networks(self) -> list[str]:
+        return sorted(
+            str(interfaces[KNOWN_NETWORK]["Name"])
+            for interfaces in self.objects.values()
+            if KNOWN_NETWORK in interfaces
+        )
+
+    def save_cache(self):
+        CACHE.parent.mkdir(parents=True, exist_ok=True)
+        CACHE.write_text(
+            json.dumps(
+                {"networks": self.get_networks(), "known": self.known_networks()}
+            )
+        )
 
+    def network_paths(self) -> dict:
+        return {
+            path: str(interfaces[NETWORK]["Name"])
+            for path, interfaces in self.objects.items()
+            if NETWORK in interfaces
+        }
 
-def run_fuzzel(options: list[str], config: Path) -> str:
+    def connect_to_network(self, ssid: str):
+        paths = self.network_paths()
+        path = next((p for p, name in paths.items() if name == ssid), None)
+        if path is None:
+            raise Exception(f"{ssid} is not in range")
+        if self.agent is None:
+            self.agent = PassphraseAgent(self.bus, paths)
+            dbus.Interface(
+                self.bus.get_object(IWD, "/net/connman/iwd"), f"{IWD}.AgentManager"
+            ).RegisterAgent(AGENT_PATH)
+        self.agent.names = paths
+        # Asynchronous, so the loop can answer iwd's RequestPassphrase.
+        result = []
+        dbus.Interface(self.bus.get_object(IWD, path), NETWORK).Connect(
+            reply_handler=lambda: result.append(None) or self.loop.quit(),
+            error_handler=lambda error: result.append(error) or self.loop.quit(),
+        )
+        self.wait(lambda: result)
+        if result[0] is not None:
+            raise result[0]
+
+
+def load_cache() -> dict:
+    try:
+        return json.loads(CACHE.read_text())
+    except (OSError, ValueError):
+        return {"networks": [], "known": []}
+
+
+def fuzzel_command(options: list[str], config: Path) -> list[str]:
     lines = len(options)
     max_chars = len(max(options, key=len))
+    return [
+        "fuzzel",
+        "--dmenu",
+        "--hide-prompt",
+        f"--width={max_chars + 1}",
+        "--lines",
+        str(lines),
+        "--config",
+        str(config),
+    ]
+
+
+def run_fuzzel(options: list[str], config: Path) -> str:
     result = subprocess.run(
-        [
-            "fuzzel",
-            "--dmenu",
-            "--hide-prompt",
-            f"--width={max_chars + 1}",
-            "--lines",
-            str(lines),
-            "--config",
-            str(config),
-        ],
+        fuzzel_command(options, config),
         input="\n".join(options),
         text=True,
         capture_output=True,
@@ -104,43 +246,66 @@ def get_wifi_password_via_zenity(ssid: str) -> str:
     return result.stdout.strip() if result.returncode == 0 else ""
 
 
-def handle_strength(strength_str: str):
-    if strength_str == "****":
-        return "󰤨"
-    elif strength_str == "***\x1b[1;90m*\x1b[0m":
-        return "󰤥"
-    elif strength_str == "**\x1b[1;90m**\x1b[0m":
-        return "󰤟"
-    elif strength_str == "*\x1b[1;90m***\x1b[0m":
-        return "󰤯"
-    return strength_str
+def handle_strength(strength: int) -> str:
+    for threshold, icon in STRENGTH_ICONS:
+        if strength > threshold:
+            return icon
+    return WEAKEST_ICON
+
+
+def wifi_options(cache: dict) -> dict[str, str]:
+    # Menu line -> SSID: the last scan, then known networks it didn't see.
+    options = {
+        f"{ssid} {handle_strength(strength)}": ssid
+        for ssid, strength in cache["networks"]
+    }
+    seen = set(options.values())
+    options.update({ssid: ssid for ssid in cache["known"] if ssid not in seen})
+    return options
 
 
-def handle_wifi(nm: NetworkManager, sleep_time: int, config):
+def handle_wifi(nm: NetworkManager, config):
     while True:
-        nm.find_device()
-        networks_raw = nm.get_networks()
-        networks = nm.filter_valid_networks(networks_raw)
-        options = []
-        for network in networks:
-            sig_strength = handle_strength(network[1])
-            options.append(f"{network[0]} {sig_strength}")
-        max_length = max(len(option) for option in options)
+        # fuzzel opens on the cached list straight away; the device lookup
+        # and a fresh scan run while it is up, and refresh the cache.
+        cache = load_cache()
+        if not cache["networks"] and not cache["known"]:
+            # First run: nothing cached yet, so ask iwd up front.
+            nm.find_device()
+            nm.save_cache()
+            cache = load_cache()
+        ssids = wifi_options(cache)
+        options = list(ssids)
+        max_length = max((len(option) for option in options), default=0)
         separator = "_" * (max_length + 3)
         lines = options + [separator, "Scan", "Back"]
-        selected_network = run_fuzzel(lines, config)
+        fuzzel = subprocess.Popen(
+            fuzzel_command(lines, config),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        fuzzel.stdin.write("\n".join(lines))
+        fuzzel.stdin.close()
+        nm.find_device()
+        nm.save_cache()
+        nm.start_scan()
+        nm.wait_for_close(fuzzel.stdout)
+        selected_network = fuzzel.stdout.read().strip()
+        fuzzel.wait()
         if selected_network in ("Back", ""):
             break
         if selected_network == "Scan":
             print("Rescanning networks...")
-            nm.scan_networks(sleep_time)
+            nm.scan_networks()
             continue
-        password = get_wifi_password_via_zenity(selected_network)
-        if password:
-            nm.connect_to_network(selected_network, password)
-            print(f"Connected to {selected_network}")
+        ssid = ssids.get(selected_network, selected_network)
+        try:
+            nm.connect_to_network(ssid)
+        except Exception as error:
+            print(f"Failed to connect to {ssid}: {error}")
         else:
-            print("Failed to get password or canceled.")
+            print(f"Connected to {ssid}")
 
 
 def run_cmd(cmd: list[str], use_sudo: bool = False) -> subprocess.CompletedProcess:
@@ -149,27 +314,28 @@ def run_cmd(cmd: list[str], use_sudo: bool = False) -> subprocess.CompletedProce
     return subprocess.run(cmd, capture_output=True, text=True)
 
 
-def get_active_interfaces() -> list[str]:
-    result = run_cmd(["wg", "show"], use_sudo=True)
+def switch_vpn(up: str | None) -> bool:
+    # Brings `up` up (or nothing, to disconnect) after taking every other
+    # WireGuard link down; the active links come from rtnetlink unprivileged.
+    active = wireguard_links()
+    down = [iface for iface in active if iface != up]
+    if up in active:
+        up = None
+    if not down and not up:
+        print("Nothing to change.")
+        return True
+    start = time.perf_counter()
+    result = run_cmd([str(WG_SWITCH), up or "", *down], use_sudo=True)
+    elapsed = time.perf_counter() - start
     if result.returncode != 0:
-        return []
-    interfaces = []
-    for line in result.stdout.splitlines():
-        line = line.strip()
-        if line.startswith("interface:"):
-            iface = line.split(":", 1)[1].strip()
-            interfaces.append(iface)
-    return interfaces
-
-
-def disconnect_current_interface() -> None:
-    current = [name for name in get_active_interfaces()]
-    if current:
-        for iface in current:
-            run_cmd(["wg-quick", "down", iface], use_sudo=True)
-            print(f"\nDisconnected successfully from {iface}")
-    else:
-        print("No active interfaces found to disconnect.")
+        print(result.stderr.strip())
+        return False
+    for iface in down:
+        print(f"\nDisconnected from {iface}")
+    if up:
+        print(f"\nConnected to {up}")
+    print(f"Switched in {elapsed:.2f}s")
+    return True
 
 
 def handle_vpn(config):
@@ -183,23 +349,15 @@ def handle_vpn(config):
             sys.exit(1)
         if choice == "Back":
             return
-        elif choice == "Disconnect":
-            disconnect_current_interface()
-            sys.exit(0)
-        else:
-            disconnect_current_interface()
-            result = run_cmd(["wg-quick", "up", choice], use_sudo=True)
-            if result.returncode != 0:
-                sys.exit(1)
-            print(f"\nConnected to {choice}")
-            sys.exit(0)
+        up = None if choice == "Disconnect" else choice
+        sys.exit(0 if switch_vpn(up) else 1)
 
 
 def main():
     while True:
         choice = run_fuzzel(MAIN_CHOICES, config=FUZZEL_CONFIG)
         if choice == "WiFi":
-            handle_wifi(NetworkManager(), sleep_time=SLEEP_TIME, config=FUZZEL_CONFIG)
+            handle_wifi(NetworkManager(), config=FUZZEL_CONFIG)
         elif choice == "VPN":
             handle_vpn(config=FUZZEL_CONFIG)
         elif choice in ("Cancel", ""):
@@ -1,11 +1,25 @@
 #!/usr/bin/env python3
 import json
-import re
+import math
+import os
 import subprocess
+import sys
 import time
+from array import array
 from pathlib import Path
 
 CACHE = Path("/tmp/waybar-wifi.json")
+NET = Path("/sys/class/net")
+WIRELESS = Path("/proc/net/wireless")
+# Written by netstate.py, which follows firewalld and WireGuard links.
+NETSTATE = Path(os.environ.get("XDG_RUNTIME_DIR", "/tmp")) / "netbar-state.json"
+
+# --daemon
+INTERVAL = 2  # seconds between samples
+HISTORY = 90  # samples kept, three minutes at INTERVAL
+TAU = 6  # EWMA time constant in seconds
+SPARK_WIDTH = 30
+SPARKS = "▁▂▃▄▅▆▇█"
 
 
 def run(cmd):
@@ -18,24 +32,54 @@ def run(cmd):
 
 
 def find_wifi_interface():
-    for dev in Path("/sys/class/net").iterdir():
+    for dev in NET.iterdir():
         if (dev / "wireless").exists():
             return dev.name
     return None
 
 
-def parse_wifi_info(station_info):
-    rssi = rx = tx = None
-    rssi_match = re.search(r"signal avg:\s+(-?\d+)", station_info)
-    rx_match = re.search(r"rx bytes:\s+(\d+)", station_info)
-    tx_match = re.search(r"tx bytes:\s+(\d+)", station_info)
-    if rssi_match:
-        rssi = int(rssi_match.group(1))
-    if rx_match:
-        rx = int(rx_match.group(1))
-    if tx_match:
-        tx = int(tx_match.group(1))
-    return rssi, rx, tx
+def wifi_interface(prev):
+    # Resolved once and kept in the cache; only rescanned if it disappears.
+    iface = prev.get("iface") if prev else None
+    if iface and (NET / iface / "wireless").exists():
+        return iface
+    return find_wifi_interface() or "wlan0"
+
+
+def read_signal(iface):
+    # /proc/net/wireless: "wlan0: 0000   54.  -56.  -256 ..."; the interface
+    # only has a row while it is associated.
+    try:
+        lines = WIRELESS.read_text().splitlines()[2:]
+    except OSError:
+        return None
+    for line in lines:
+        name, _, fields = line.partition(":")
+        if name.strip() == iface:
+            return int(float(fields.split()[2]))
+    return None
+
+
+def read_counters(iface):
+    stats = NET / iface / "statistics"
+    try:
+        return (
+            int((stats / "rx_bytes").read_text()),
+            int((stats / "tx_bytes").read_text()),
+        )
+    except OSError:
+        return None, None
+
+
+def wireguard_interfaces():
+    names = []
+    for dev in NET.iterdir():
+        try:
+            if "DEVTYPE=wireguard" in (dev / "uevent").read_text():
+                names.append(dev.name)
+        except OSError:
+            continue
+    return " ".join(sorted(names))
 
 
 def compute_signal_strength(rssi):
@@ -54,8 +98,8 @@ def load_previous_stats():
         return None
 
 
-def save_stats(rx, tx):
-    CACHE.write_text(json.dumps({"rx": rx, "tx": tx, "t": time.time()}))
+def save_stats(iface, rx, tx):
+    CACHE.write_text(json.dumps({"iface": iface, "rx": rx, "tx": tx, "t": time.time()}))
 
 
 def compute_speeds(prev, rx, tx):
@@ -64,8 +108,9 @@ def compute_speeds(prev, rx, tx):
     dt = time.time() - prev.get("t", 0)
     if dt <= 0.5:
         return 0, 0
-    upload_rate = (tx - prev.get("tx", 0)) / dt
-    download_rate = (rx - prev.get("rx", 0)) / dt
+    # Counters restart from zero when the interface is recreated.
+    upload_rate = max(0, tx - prev.get("tx", 0)) / dt
+    download_rate = max(0, rx - prev.get("rx", 0)) / dt
     return upload_rate, download_rate
 
 
@@ -78,6 +123,15 @@ def get_firewalld_zone():
     return zone_name
 
 
+def read_netstate():
+    # Zone and VPN names from netstate.py; queried directly if it isn't running.
+    try:
+        state = json.loads(NETSTATE.read_text())
+        return state["zone"], " ".join(state["vpn"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return get_firewalld_zone(), wireguard_interfaces()
+
+
 def build_tooltip(iface, strength, rssi, upload, download, vpn, zone_name):
     lines = [
         f"{iface}\t\n·{strength}%\t\n·{rssi}dBm\t\n↑{upload / 1_048_576:.1f}M\t\n↓{download / 1_048_576:.1f}M\t\n{zone_name} 󱨑\t"
@@ -87,35 +141,134 @@ def build_tooltip(iface, strength, rssi, upload, download, vpn, zone_name):
     return "\n".join(lines)
 
 
-def output_json(icon, tooltip, vpn_active):
-    print(
-        json.dumps(
-            {
-                "text": icon,
-                "tooltip": tooltip,
-                "class": "vpn" if vpn_active else "wifi",
-            },
-            ensure_ascii=False,
-        )
+def format_output(icon, tooltip, vpn_active):
+    return json.dumps(
+        {
+            "text": icon,
+            "tooltip": tooltip,
+            "class": "vpn" if vpn_active else "wifi",
+        },
+        ensure_ascii=False,
     )
 
 
+def output_json(icon, tooltip, vpn_active):
+    print(format_output(icon, tooltip, vpn_active))
+
+
+class History:
+    # Fixed-size ring of per-sample rates and signal strength, kept in
+    # flat arrays so a long-running bar never grows.
+    def __init__(self, size):
+        self.size = size
+        self.count = 0
+        self.pos = 0
+        self.rx = array("d", bytes(8 * size))
+        self.tx = array("d", bytes(8 * size))
+        self.signal = array("d", bytes(8 * size))
+
+    def push(self, rx_rate, tx_rate, strength):
+        self.rx[self.pos] = rx_rate
+        self.tx[self.pos] = tx_rate
+        self.signal[self.pos] = strength
+        self.pos = (self.pos + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def ordered(self, series):
+        # Oldest first.
+        if self.count < self.size:
+            return series[: self.count]
+        return series[self.pos :] + series[: self.pos]
+
+
+def sparkline(values, top=None):
+    # Buckets the samples into SPARK_WIDTH columns, each showing its peak.
+    if not values:
+        return ""
+    step = math.ceil(len(values) / SPARK_WIDTH)
+    peaks = [max(values[i : i + step]) for i in range(0, len(values), step)]
+    top = top or max(peaks) or 1
+    last = len(SPARKS) - 1
+    return "".join(SPARKS[min(last, round(v / top * last))] for v in peaks)
+
+
+def history_lines(history):
+    rx = history.ordered(history.rx)
+    tx = history.ordered(history.tx)
+    signal = history.ordered(history.signal)
+    return [
+        f"↓{sparkline(rx)} {max(rx, default=0) / 1_048_576:.1f}M\t",
+        f"↑{sparkline(tx)} {max(tx, default=0) / 1_048_576:.1f}M\t",
+        f"·{sparkline(signal, top=100)}\t",
+    ]
+
+
+def daemon():
+    # Stays resident under waybar: samples every INTERVAL, smooths rates with
+    # an EWMA on monotonic time and prints only when the output changes.
+    history = History(HISTORY)
+    iface = None
+    last = None  # (monotonic time, iface, rx, tx)
+    upload = download = 0.0
+    last_output = None
+    next_sample = time.monotonic()
+    while True:
+        zone_name, vpn = read_netstate()
+        iface = wifi_interface({"iface": iface})
+        rssi = read_signal(iface)
+        rx_bytes, tx_bytes = read_counters(iface)
+        now = time.monotonic()
+        if rssi is None or rx_bytes is None or tx_bytes is None:
+            output = format_output("󰤫", f"No WiFi link\n{zone_name}", False)
+            last = None
+            upload = download = 0.0
+        else:
+            strength, icon = compute_signal_strength(rssi)
+            rx_rate = tx_rate = 0.0
+            if last and last[1] == iface and now > last[0]:
+                dt = now - last[0]
+                rx_rate = max(0, rx_bytes - last[2]) / dt
+                tx_rate = max(0, tx_bytes - last[3]) / dt
+                # Weight by elapsed time, so a late sample counts for more.
+                alpha = 1 - math.exp(-dt / TAU)
+                download += alpha * (rx_rate - download)
+                upload += alpha * (tx_rate - upload)
+            last = (now, iface, rx_bytes, tx_bytes)
+            history.push(rx_rate, tx_rate, strength)
+            tooltip = build_tooltip(
+                iface, strength, rssi, upload, download, vpn, zone_name
+            )
+            tooltip = "\n".join([tooltip, *history_lines(history)])
+            output = format_output(icon, tooltip, bool(vpn))
+        if output != last_output:
+            print(output, flush=True)
+            last_output = output
+        next_sample += INTERVAL
+        delay = next_sample - time.monotonic()
+        if delay < 0:  # fell behind (suspend); don't try to catch up
+            next_sample = time.monotonic()
+            delay = 0
+        time.sleep(delay)
+
+
 def main():
-    vpn = run(["wg", "show", "interfaces"])
-    iface = find_wifi_interface() or "wlan0"
-    station_info = run(["iw", "dev", iface, "station", "dump"])
-    rssi, rx_bytes, tx_bytes = parse_wifi_info(station_info)
+    zone_name, vpn = read_netstate()
+    prev = load_previous_stats()
+    iface = wifi_interface(prev)
+    rssi = read_signal(iface)
+    rx_bytes, tx_bytes = read_counters(iface)
     if rssi is None or rx_bytes is None or tx_bytes is None:
-        output_json("󰤫", f"No WiFi link\n{get_firewalld_zone()}", False)
+        output_json("󰤫", f"No WiFi link\n{zone_name}", False)
         return
     strength, icon = compute_signal_strength(rssi)
-    prev = load_previous_stats()
     upload, download = compute_speeds(prev, rx_bytes, tx_bytes)
-    zone_name = get_firewalld_zone()
-    save_stats(rx_bytes, tx_bytes)
+    save_stats(iface, rx_bytes, tx_bytes)
     tooltip = build_tooltip(iface, strength, rssi, upload, download, vpn, zone_name)
     output_json(icon, tooltip, bool(vpn))
 
 
 if __name__ == "__main__":
-    main()
+    if "--daemon" in sys.argv[1:]:
+        daemon()
+    else:
+        main()
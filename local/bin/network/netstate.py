@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+import json
+import os
+import signal
+import socket
+import struct
+from pathlib import Path
+
+import dbus
+from dbus.mainloop.glib import DBusGMainLoop
+from gi.repository import GLib
+
+STATE_FILE = Path(os.environ.get("XDG_RUNTIME_DIR", "/tmp")) / "netbar-state.json"
+FIREWALLD = "org.fedoraproject.FirewallD1"
+FIREWALLD_PATH = "/org/fedoraproject/FirewallD1"
+
+# rtnetlink(7)
+NETLINK_ROUTE = 0
+RTMGRP_LINK = 1
+NLMSG_DONE = 3
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_GETLINK = 18
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+IFLA_IFNAME = 3
+IFLA_LINKINFO = 18
+IFLA_INFO_KIND = 1
+NLMSG_HEADER = struct.Struct("=LHHLL")
+IFINFO = struct.Struct("=BxHiII")
+RTATTR = struct.Struct("=HH")
+
+
+def attributes(data, pos, end):
+    # Yields (type, payload) for each rtattr in data[pos:end].
+    while pos + RTATTR.size <= end:
+        length, kind = RTATTR.unpack_from(data, pos)
+        if length < RTATTR.size:
+            return
+        yield kind, data[pos + RTATTR.size : pos + length]
+        pos += (length + 3) & ~3
+
+
+class FirewallWatcher:
+    # Reads the active zone once and again only when firewalld signals a
+    # change, reloads, or comes and goes on the bus.
+    def __init__(self, bus, on_change):
+        self.bus = bus
+        self.on_change = on_change
+        self.zone = self.query()
+        bus.add_signal_receiver(self.changed, bus_name=FIREWALLD)
+        bus.add_signal_receiver(
+            self.changed,
+            signal_name="NameOwnerChanged",
+            dbus_interface="org.freedesktop.DBus",
+            arg0=FIREWALLD,
+        )
+
+    def query(self):
+        try:
+            firewalld = self.bus.get_object(FIREWALLD, FIREWALLD_PATH)
+            zones = firewalld.getActiveZones(dbus_interface=f"{FIREWALLD}.zone")
+        except dbus.DBusException:
+            return "off"
+        return str(next(iter(zones), "off"))
+
+    def changed(self, *args):
+        zone = self.query()
+        if zone != self.zone:
+            self.zone = zone
+            self.on_change()
+
+
+class WireguardWatcher:
+    # Follows link add/remove messages on an rtnetlink socket. The initial
+    # GETLINK dump is read up front and goes through the same parser.
+    def __init__(self, on_change=None):
+        self.on_change = on_change
+        self.links = {}  # ifindex -> name, wireguard links only
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+        self.sock.bind((0, RTMGRP_LINK))
+        request = NLMSG_HEADER.pack(
+            NLMSG_HEADER.size + IFINFO.size,
+            RTM_GETLINK,
+            NLM_F_REQUEST | NLM_F_DUMP,
+            1,
+            0,
+        ) + IFINFO.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+        self.sock.send(request)
+        while not self.read():
+            pass
+        if on_change:
+            GLib.io_add_watch(self.sock.fileno(), GLib.IO_IN, self.on_messages)
+
+    @property
+    def names(self):
+        return sorted(self.links.values())
+
+    def read(self):
+        # Handles one datagram; True once it held the end of the dump.
+        data = self.sock.recv(65536)
+        pos = 0
+        while pos + NLMSG_HEADER.size <= len(data):
+            length, kind, _, _, _ = NLMSG_HEADER.unpack_from(data, pos)
+            if kind == NLMSG_DONE:
+                return True
+            if length < NLMSG_HEADER.size:
+                break
+            if kind in (RTM_NEWLINK, RTM_DELLINK):
+                self.link_message(kind, data, pos + NLMSG_HEADER.size, pos + length)
+            pos += (length + 3) & ~3
+        return False
+
+    def on_messages(self, fd, condition):
+        before = self.names
+        self.read()
+        if self.names != before:
+            self.on_change()
+        return True
+
+    def link_message(self, kind, data, pos, end):
+        _, _, index, _, _ = IFINFO.unpack_from(data, pos)
+        if kind == RTM_DELLINK:
+            self.links.pop(index, None)
+            return
+        name = link_kind = None
+        for attr, payload in attributes(data, pos + IFINFO.size, end):
+            if attr == IFLA_IFNAME:
+                name = payload.rstrip(b"\0").decode()
+            elif attr == IFLA_LINKINFO:
+                for info, value in attributes(payload, 0, len(payload)):
+                    if info == IFLA_INFO_KIND:
+                        link_kind = value.rstrip(b"\0").decode()
+        if link_kind == "wireguard" and name:
+            self.links[index] = name
+        else:
+            self.links.pop(index, None)
+
+
+def wireguard_links():
+    # The WireGuard links up right now, without following later changes.
+    watcher = WireguardWatcher()
+    watcher.sock.close()
+    return watcher.names
+
+
+def main():
+    DBusGMainLoop(set_as_default=True)
+    last = None
+
+    def save():
+        nonlocal last
+        state = {"zone": firewall.zone, "vpn": wireguard.names}
+        if state == last:
+            return
+        # netbar.py reads this on every refresh; replace it atomically.
+        tmp = STATE_FILE.with_suffix(".tmp")
+        tmp.write_text(json.dumps(state))
+        tmp.replace(STATE_FILE)
+        last = state
+
+    firewall = FirewallWatcher(dbus.SystemBus(), on_change=save)
+    wireguard = WireguardWatcher(on_change=save)
+    save()
+    loop = GLib.MainLoop()
+    GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGTERM, loop.quit)
+    try:
+        loop.run()
+    finally:
+        # A stale file would show a zone and VPN that are no longer watched.
+        STATE_FILE.unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,53 @@
 #!/usr/bin/env python3
 
 import json
+import os
+import socket
 import subprocess
 import sys
 import re
+import time
 from pathlib import Path
-from datetime import datetime, timezone
+from datetime import datetime
 
 STATE_FILE = Path.home() / ".cache" / "timer_state.json"
+CONTROL_SOCKET = Path(os.environ.get("XDG_RUNTIME_DIR", "/tmp")) / "timer_waybar.sock"
+DEFAULT_NAMES = {"timer": "timer", "stopwatch": "stopwatch"}
+ALARM_PREFIX = "timer-alarm-"
+
+# State layout: {"unit": ..., "timers": {name: entry}}. A timer entry holds
+# the seconds left at its last (re)start in "duration"; a stopwatch entry the
+# seconds already counted in "elapsed". "started" is the epoch it last
+# started running, or None while paused.
+
+
+def upgrade_state(data) -> dict:
+    if not isinstance(data, dict):
+        return {"timers": {}}
+    if "timers" in data:
+        return data
+    # The single-timer layout: ISO timestamps, "paused_at" while paused.
+    state = {"timers": {}}
+    if data.get("unit"):
+        state["unit"] = data["unit"]
+    if data.get("duration"):
+        start = data.get("start_time") if data.get("paused_at") is None else None
+        state["timers"][DEFAULT_NAMES["timer"]] = {
+            "kind": "timer",
+            "duration": data["duration"],
+            "started": datetime.fromisoformat(start).timestamp() if start else None,
+            "created": time.time(),
+        }
+    return state
 
 
 def load_state() -> dict:
     if not STATE_FILE.exists():
-        return {}
+        return {"timers": {}}
     try:
-        return json.loads(STATE_FILE.read_text())
-    except json.JSONDecodeError:
-        return {}
+        return upgrade_state(json.loads(STATE_FILE.read_text()))
+    except (json.JSONDecodeError, ValueError):
+        return {"timers": {}}
 
 
 def save_state(state: dict):
@@ -31,7 +62,10 @@ def clear_state():
 
 
 def notify(msg: str):
-    subprocess.run(["notify-send", "-a", "Timer", msg], check=False)
+    try:
+        subprocess.run(["notify-send", "-a", "Timer", msg], check=False)
+    except OSError:
+        pass  # no notification daemon tooling installed
 
 
 def format_seconds(secs: int) -> str:
@@ -57,35 +91,158 @@ def parse_duration(text: str) -> int:
     return max(0, total)
 
 
-def default_step_for_unit() -> int:
-    return 5 if get_current_unit() == "seconds" else 1
+class TimerError(Exception):
+    pass
 
 
 UNITS = ["minutes", "hours", "seconds"]
 UNIT_MULTIPLIER = {"minutes": 60, "hours": 3600, "seconds": 1}
 
 
-def get_current_unit() -> str:
-    unit = load_state().get("unit")
+# ----------------------------------------------------------------------
+# Entries
+# ----------------------------------------------------------------------
+def is_running(entry: dict) -> bool:
+    return entry.get("started") is not None
+
+
+def is_paused(entry: dict) -> bool:
+    return entry.get("started") is None
+
+
+def deadline(entry: dict) -> float | None:
+    if entry["kind"] != "timer" or not is_running(entry):
+        return None
+    return entry["started"] + entry["duration"]
+
+
+def remaining_seconds(entry: dict, now: float) -> float:
+    if not is_running(entry):
+        return entry["duration"]
+    return max(0.0, entry["duration"] - (now - entry["started"]))
+
+
+def elapsed_seconds(entry: dict, now: float) -> float:
+    if not is_running(entry):
+        return entry["elapsed"]
+    return entry["elapsed"] + (now - entry["started"])
+
+
+def entry_seconds(entry: dict, now: float) -> float:
+    if entry["kind"] == "timer":
+        return remaining_seconds(entry, now)
+    return elapsed_seconds(entry, now)
+
+
+def focus_key(item: tuple[str, dict], now: float) -> tuple:
+    # Finished timers first, then running timers by deadline, then running
+    # stopwatches, then anything paused; oldest first within a group.
+    _, entry = item
+    end = deadline(entry)
+    if end is not None:
+        return (0 if end <= now else 1, end)
+    return (2 if is_running(entry) else 3, entry["created"])
+
+
+def finish_times(state: dict) -> dict[str, float]:
+    return {
+        name: end
+        for name, entry in state["timers"].items()
+        if (end := deadline(entry)) is not None
+    }
+
+
+def focused_name(state: dict, now: float) -> str | None:
+    timers = state["timers"]
+    if not timers:
+        return None
+    return min(timers.items(), key=lambda item: focus_key(item, now))[0]
+
+
+# ----------------------------------------------------------------------
+# Alarms
+# ----------------------------------------------------------------------
+# Each running timer's finish is a transient systemd --user timer, so the
+# notification fires on time without polling and whether or not the bar
+# is running.
+def alarm_unit(name: str) -> str:
+    return ALARM_PREFIX + re.sub(r"[^A-Za-z0-9_.-]", "_", name)
+
+
+def run_quiet(cmd: list[str]):
+    try:
+        subprocess.run(
+            cmd, check=False, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+    except OSError:
+        pass
+
+
+def cancel_alarm(name: str):
+    run_quiet(["systemctl", "--user", "stop", f"{alarm_unit(name)}.timer"])
+
+
+def schedule_alarm(name: str, seconds: float):
+    cancel_alarm(name)
+    run_quiet(
+        [
+            "systemd-run",
+            "--user",
+            "--quiet",
+            "--collect",
+            f"--unit={alarm_unit(name)}",
+            f"--on-active={max(1, round(seconds * 1000))}ms",
+            "--timer-property=AccuracySec=100ms",
+            "--timer-property=RemainAfterElapsed=no",
+            "notify-send",
+            "-a",
+            "Timer",
+            "-u",
+            "critical",
+            f"{label(name)}Timer finished!",
+        ]
+    )
+
+
+def sync_alarms(before: dict[str, float], after: dict[str, float]):
+    # Compare finish times around a command (or a whole burst of them) and
+    # only touch the units whose deadline actually moved.
+    now = time.time()
+    for name in before.keys() - after.keys():
+        cancel_alarm(name)
+    for name, end in after.items():
+        if before.get(name) != end and end > now:
+            schedule_alarm(name, end - now)
+
+
+# ----------------------------------------------------------------------
+# Operations
+# ----------------------------------------------------------------------
+# The operations below work on a state dict in memory, so timer_waybar.py can
+# apply a whole burst of control messages and save once.
+def default_step_for_unit(state: dict) -> int:
+    return 5 if get_current_unit(state) == "seconds" else 1
+
+
+def get_current_unit(state: dict) -> str:
+    unit = state.get("unit")
     return unit if unit in UNITS else "minutes"
 
 
-def set_unit(unit: str):
+def set_unit(state: dict, unit: str):
     if unit not in UNITS:
         return
-    state = load_state()
     state["unit"] = unit
-    save_state(state)
 
 
-def cycle_unit():
-    current = get_current_unit()
+def cycle_unit(state: dict):
+    current = get_current_unit(state)
     idx = UNITS.index(current)
     new_unit = UNITS[(idx + 1) % 3]
-    set_unit(new_unit)
+    set_unit(state, new_unit)
 
 
-def get_adjust_delta(amount_str: str) -> int:
+def get_adjust_delta(state: dict, amount_str: str) -> int:
     amount_str = amount_str.strip().lower()
     if re.match(r"^\d+\s*[hms]$", amount_str):
         return parse_duration(amount_str)
@@ -93,97 +250,181 @@ def get_adjust_delta(amount_str: str) -> int:
         value = int(amount_str)
     except ValueError:
         value = 1
-    return value * UNIT_MULTIPLIER[get_current_unit()]
+    return value * UNIT_MULTIPLIER[get_current_unit(state)]
 
 
-def is_running():
-    s = load_state()
-    return bool(s.get("start_time") and s.get("paused_at") is None)
+def label(name: str) -> str:
+    return "" if name in DEFAULT_NAMES.values() else f"{name}: "
 
 
-def is_paused():
-    s = load_state()
-    return bool(s.get("duration") and s.get("paused_at"))
-
-
-def remaining_seconds():
-    s = load_state()
-    if not s.get("duration"):
-        return 0
-    if s.get("paused_at"):
-        return int(s["duration"])
-    elapsed = (
-        datetime.now(timezone.utc) - datetime.fromisoformat(s["start_time"])
-    ).total_seconds()
-    return max(0, int(s["duration"] - elapsed))
+def target(state: dict, name: str | None) -> tuple[str, dict]:
+    name = name or focused_name(state, time.time())
+    if name is None or name not in state["timers"]:
+        notify("No timer")
+        raise TimerError("no timer")
+    return name, state["timers"][name]
 
 
-def start_timer(seconds: int):
+def start_timer(state: dict, seconds: int, name: str | None = None):
     if seconds <= 0:
         notify("Invalid duration")
-        sys.exit(1)
-    now = datetime.now(timezone.utc).isoformat()
-    state = load_state()
-    state.update(
-        {
-            "duration": seconds,
-            "start_time": now,
-            "paused_at": None,
-            "created_at": now,
-            "unit": state.get("unit", "minutes"),
-        }
-    )
-    save_state(state)
-    notify(f"Started — {format_seconds(seconds)}")
-
-
-def pause_timer():
-    if not is_running():
+        raise TimerError("invalid duration")
+    name = name or DEFAULT_NAMES["timer"]
+    now = time.time()
+    state["timers"][name] = {
+        "kind": "timer",
+        "duration": seconds,
+        "started": now,
+        "created": now,
+    }
+    notify(f"{label(name)}Started — {format_seconds(seconds)}")
+
+
+def start_stopwatch(state: dict, name: str | None = None):
+    name = name or DEFAULT_NAMES["stopwatch"]
+    now = time.time()
+    state["timers"][name] = {
+        "kind": "stopwatch",
+        "elapsed": 0.0,
+        "started": now,
+        "created": now,
+    }
+    notify(f"{label(name)}Stopwatch started")
+
+
+def pause_timer(state: dict, name: str | None = None):
+    name, entry = target(state, name)
+    if not is_running(entry):
         notify("Not running")
         return
-    s = load_state()
-    elapsed = (
-        datetime.now(timezone.utc) - datetime.fromisoformat(s["start_time"])
-    ).total_seconds()
-    remaining = max(0, int(s["duration"] - elapsed))
-    s["duration"] = remaining
-    s["paused_at"] = datetime.now(timezone.utc).isoformat()
-    s.pop("start_time", None)
-    save_state(s)
-    notify(f"Paused — {format_seconds(remaining)}")
-
-
-def resume_timer():
-    if not is_paused():
+    now = time.time()
+    if entry["kind"] == "timer":
+        entry["duration"] = max(0, int(remaining_seconds(entry, now)))
+    else:
+        entry["elapsed"] = elapsed_seconds(entry, now)
+    entry["started"] = None
+    notify(f"{label(name)}Paused — {format_seconds(entry_seconds(entry, now))}")
+
+
+def resume_timer(state: dict, name: str | None = None):
+    name, entry = target(state, name)
+    if not is_paused(entry):
         notify("Not paused")
         return
-    s = load_state()
-    s["start_time"] = datetime.now(timezone.utc).isoformat()
-    s["paused_at"] = None
-    save_state(s)
-    notify(f"Resumed — {format_seconds(s['duration'])}")
+    now = time.time()
+    entry["started"] = now
+    notify(f"{label(name)}Resumed — {format_seconds(entry_seconds(entry, now))}")
 
 
-def toggle_pause():
-    if is_running():
-        pause_timer()
-    elif is_paused():
-        resume_timer()
+def toggle_pause(state: dict, name: str | None = None):
+    if not state["timers"]:
+        return
+    name, entry = target(state, name)
+    if is_running(entry):
+        pause_timer(state, name)
+    else:
+        resume_timer(state, name)
 
 
-def adjust_timer(delta: int):
-    s = load_state()
-    if not s.get("duration"):
+def adjust_timer(state: dict, delta: int, name: str | None = None):
+    _, entry = target(state, name)
+    if entry["kind"] != "timer":
         notify("No timer")
-        sys.exit(1)
-    new = max(1, s["duration"] + delta)  # never destroy
-    s["duration"] = new
-    clear_state()
-    save_state(s)
+        raise TimerError("no timer")
+    # Shift the deadline by delta, never below one second.
+    left = remaining_seconds(entry, time.time())
+    entry["duration"] += max(1 - left, delta)  # never destroy
+
+
+def stop_timer(state: dict, name: str | None = None):
+    if not state["timers"]:
+        return
+    name, _ = target(state, name)
+    del state["timers"][name]
+
+
+def bad_usage(msg: str):
+    notify(msg)
+    raise TimerError(msg)
+
+
+def pop_name(args: list[str]) -> tuple[str | None, list[str]]:
+    if "--name" not in args:
+        return None, args
+    i = args.index("--name")
+    if i + 1 >= len(args):
+        bad_usage("--name needs a value")
+    return args[i + 1], args[:i] + args[i + 2 :]
+
+
+def run_command(state: dict, args: list[str]):
+    name, args = pop_name(args)
+    arg = args[0] if args else "--toggle"
+    if arg == "-t" and len(args) < 2:
+        bad_usage("-t needs a duration")
+    match arg:
+        case "--stop":
+            stop_timer(state, name)
+        case "--toggle":
+            toggle_pause(state, name)
+        case "--stopwatch":
+            start_stopwatch(state, name)
+        case "--unit":
+            if len(args) > 1:
+                unit = {"h": "hours", "m": "minutes", "s": "seconds"}.get(
+                    args[1].lower()
+                )
+                if unit is None:
+                    bad_usage(f"Unknown unit: {args[1]}")
+                set_unit(state, unit)
+            else:
+                cycle_unit(state)
+        case "--up" | "--down":
+            direction = 1 if arg == "--up" else -1
+            if len(args) > 1:
+                if not re.match(r"^\s*(\d+\s*[hms]|\d+)\s*$", args[1].lower()):
+                    bad_usage(f"Bad step: {args[1]}")
+                delta = get_adjust_delta(state, args[1])
+            else:
+                delta = (
+                    default_step_for_unit(state)
+                    * UNIT_MULTIPLIER[get_current_unit(state)]
+                )
+            adjust_timer(state, direction * delta, name)
+        case "-t":
+            start_timer(state, parse_duration(args[1]), name)
+        case _:
+            start_timer(state, parse_duration(arg), name)
+
+
+def forward(args: list[str]) -> bool:
+    # Hand the command to a running timer_waybar.py; it applies it to the
+    # state it already holds, so a scroll burst doesn't race on the file.
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.sendto(json.dumps(args).encode(), str(CONTROL_SOCKET))
+    except OSError:
+        return False
+    return True
+
+
+def print_status(state: dict):
+    now = time.time()
+    name = focused_name(state, now)
+    if name is None:
+        print("None")
+        return
+    timers = state["timers"]
+    ordered = sorted(timers.items(), key=lambda item: focus_key(item, now))
+    for name, entry in ordered:
+        kind = "RUN" if is_running(entry) else "PAUSE"
+        seconds = format_seconds(entry_seconds(entry, now))
+        print(f"{kind} {seconds}" if len(timers) == 1 else f"{name} {kind} {seconds}")
 
 
 def main():
-    if len(sys.argv) == 1:
+    args = sys.argv[1:]
+    if not args:
         res = subprocess.run(
             [
                 "zenity",
@@ -199,42 +440,24 @@ def main():
         )
         if res.returncode != 0:
             sys.exit(0)
-        start_timer(parse_duration(res.stdout.strip()))
+        args = ["-t", res.stdout.strip()]
+    if args[0] == "--status":
+        print_status(load_state())
         return
-    arg = sys.argv[1]
-    match arg:
-        case "--stop":
-            clear_state()
-        case "--toggle":
-            toggle_pause()
-        case "--unit":
-            if len(sys.argv) > 2:
-                set_unit(
-                    {"h": "hours", "m": "minutes", "s": "seconds"}.get(
-                        sys.argv[2].lower(), "minutes"
-                    )
-                )
-            else:
-                cycle_unit()
-        case "--up" | "--down":
-            direction = 1 if arg == "--up" else -1
-            if len(sys.argv) > 2:
-                delta = get_adjust_delta(sys.argv[2])
-            else:
-                delta = default_step_for_unit() * UNIT_MULTIPLIER[get_current_unit()]
-            adjust_timer(direction * delta)
-        case "--status":
-            get_current_unit()
-            if is_running():
-                print(f"RUN {format_seconds(remaining_seconds())}")
-            elif is_paused():
-                print(f"PAUSE {format_seconds(remaining_seconds())}")
-            else:
-                print("None")
-        case "-t":
-            start_timer(parse_duration(sys.argv[2]))
-        case _:
-            start_timer(parse_duration(arg))
+    if forward(args):
+        return
+    # No bar is listening: apply the command to the state file directly.
+    state = load_state()
+    before = finish_times(state)
+    try:
+        run_command(state, args)
+    except TimerError:
+        sys.exit(1)
+    sync_alarms(before, finish_times(state))
+    if state["timers"] or state.get("unit"):
+        save_state(state)
+    else:
+        clear_state()
 
 
 if __name__ == "__main__":
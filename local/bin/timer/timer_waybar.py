@@ -1,17 +1,33 @@
 #!/usr/bin/env python3
 
+import ctypes
+import ctypes.util
+import heapq
 import json
+import math
+import os
+import select
+import socket
+import struct
 import sys
 import time
 from pathlib import Path
-from datetime import datetime, timezone
 from typing import Any
 
+import set_timer
+
 # ----------------------------------------------------------------------
 # Config
 # ----------------------------------------------------------------------
 STATE_FILE = Path.home() / ".cache" / "timer_state.json"
 
+# inotify(7) masks: set_timer.py replaces the file through a rename and
+# --stop unlinks it, so watch the directory rather than the file itself.
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_DELETE = 0x200
+EVENT_HEADER = struct.Struct("iIII")
+
 
 # ----------------------------------------------------------------------
 # Helpers
@@ -25,12 +41,91 @@ def format_seconds(secs: int) -> str:
 
 def load_state() -> dict:
     if not STATE_FILE.exists():
-        return {}
+        return {"timers": {}}
     try:
-        data = json.loads(STATE_FILE.read_text())
-        return data if isinstance(data, dict) else {}
+        return set_timer.upgrade_state(json.loads(STATE_FILE.read_text()))
     except Exception:
-        return {}
+        return {"timers": {}}
+
+
+def schedule(state: dict) -> list[tuple[float, str]]:
+    # Min-heap of upcoming finish deadlines, rebuilt whenever the state
+    # changes; the loop only ever looks at the head.
+    heap = [
+        (end, name)
+        for name, entry in state["timers"].items()
+        if (end := set_timer.deadline(entry)) is not None
+    ]
+    heapq.heapify(heap)
+    return heap
+
+
+def open_control_socket() -> socket.socket:
+    # set_timer.py sends its argv here as one JSON datagram per invocation.
+    path = set_timer.CONTROL_SOCKET
+    path.unlink(missing_ok=True)
+    control = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    control.bind(str(path))
+    control.setblocking(False)
+    return control
+
+
+def apply_commands(control: socket.socket, state: dict) -> bool:
+    # Drain everything queued since the last wake, so a burst of scroll
+    # ticks is applied in one go and saved once.
+    applied = False
+    while True:
+        try:
+            args = json.loads(control.recv(4096))
+        except BlockingIOError:
+            return applied
+        except ValueError:
+            continue
+        if not isinstance(args, list) or not args:
+            continue
+        try:
+            set_timer.run_command(state, [str(arg) for arg in args])
+        except set_timer.TimerError:
+            continue
+        except Exception as error:
+            # One bad datagram must not take the bar down with it.
+            print(f"timer_waybar: ignoring {args}: {error!r}", file=sys.stderr)
+            continue
+        applied = True
+
+
+class StateWatcher:
+    def __init__(self, path: Path):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_DELETE
+        if libc.inotify_add_watch(self.fd, os.fsencode(path.parent), mask) < 0:
+            raise OSError(
+                ctypes.get_errno(), f"inotify_add_watch failed: {path.parent}"
+            )
+        self.name = os.fsencode(path.name)
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def changed(self) -> bool:
+        # Drain pending events; True if any of them touched the state file.
+        changed = False
+        while True:
+            try:
+                data = os.read(self.fd, 4096)
+            except BlockingIOError:
+                return changed
+            pos = 0
+            while pos < len(data):
+                _, _, _, length = EVENT_HEADER.unpack_from(data, pos)
+                pos += EVENT_HEADER.size
+                name = data[pos : pos + length].rstrip(b"\0")
+                pos += length
+                changed |= name == self.name
 
 
 # ----------------------------------------------------------------------
@@ -40,12 +135,9 @@ def case_no_timer() -> dict[str, Any]:
     return {"text": ""}
 
 
-def case_running(state: dict) -> dict[str, Any]:
-    start_time = datetime.fromisoformat(state["start_time"])
-    elapsed = (datetime.now(timezone.utc) - start_time).total_seconds()
-    remaining = max(0, int(state["duration"] - elapsed))
+def case_running(state: dict, remaining: int) -> dict[str, Any]:
     text = format_seconds(remaining)
-    unit = load_state().get("unit")
+    unit = set_timer.get_current_unit(state)
     # Optional: flash when < 1 minute
     if unit == "minutes":
         icon = "󰔛"
@@ -62,8 +154,7 @@ def case_running(state: dict) -> dict[str, Any]:
     }
 
 
-def case_paused(state: dict) -> dict[str, Any]:
-    remaining = int(state["duration"])
+def case_paused(remaining: int) -> dict[str, Any]:
     text = format_seconds(remaining)
     return {
         "text": f"⏸ {text}",
@@ -82,50 +173,118 @@ def case_finished() -> dict[str, Any]:
     }
 
 
+def case_stopwatch(elapsed: int, running: bool) -> dict[str, Any]:
+    text = format_seconds(elapsed)
+    return {
+        "text": f"{'⏱' if running else '⏸'} {text}",
+        "tooltip": f"Stopwatch — {text}" + ("" if running else " (paused)"),
+        "class": "stopwatch" if running else "paused",
+        "alt": "stopwatch",
+    }
+
+
+def summary_line(name: str, entry: dict, now: float) -> str:
+    seconds = set_timer.entry_seconds(entry, now)
+    if entry["kind"] == "stopwatch":
+        status = "stopwatch" if set_timer.is_running(entry) else "stopwatch, paused"
+    elif not set_timer.is_running(entry):
+        status = "paused"
+    else:
+        status = "done" if seconds <= 0 else "left"
+    return f"{name}: {format_seconds(seconds)} {status}"
+
+
+def next_tick(seconds: float, counting_down: bool) -> float:
+    # The display floors the seconds, so it next changes when they cross an
+    # integer: downwards for a timer (which is also its finish deadline once
+    # under a second is left), upwards for a stopwatch.
+    fraction = seconds - math.floor(seconds)
+    return (fraction if counting_down else 1.0 - fraction) or 1.0
+
+
+def evaluate(
+    state: dict, heap: list[tuple[float, str]], now: float
+) -> tuple[dict[str, Any], float | None]:
+    # Returns the output plus the time of the next visible change, or None
+    # when nothing changes until set_timer.py writes the state again.
+    while heap and heap[0][0] <= now:
+        heapq.heappop(heap)  # finished; shown as DONE until stopped
+    timers = state["timers"]
+    name = set_timer.focused_name(state, now)
+    if name is None:
+        return case_no_timer(), None
+
+    entry = timers[name]
+    running = set_timer.is_running(entry)
+    seconds = set_timer.entry_seconds(entry, now)
+    next_change = None
+    if entry["kind"] == "stopwatch":
+        output = case_stopwatch(int(seconds), running)
+        if running:
+            next_change = now + next_tick(seconds, counting_down=False)
+    elif not running:
+        output = case_paused(int(seconds))
+    elif seconds <= 0:
+        output = case_finished()
+    else:
+        output = case_running(state, int(seconds))
+        next_change = now + next_tick(seconds, counting_down=True)
+
+    if next_change is None:
+        # A static bar (paused or DONE) still has to keep running entries in
+        # the tooltip current.
+        ticking = [entry for entry in timers.values() if set_timer.is_running(entry)]
+        if ticking:
+            seconds = set_timer.entry_seconds(ticking[0], now)
+            counting_down = ticking[0]["kind"] == "timer" and seconds > 0
+            next_change = now + next_tick(seconds, counting_down)
+    # The soonest deadline can change what the bar focuses on.
+    if heap and (next_change is None or heap[0][0] < next_change):
+        next_change = heap[0][0]
+    others = [
+        summary_line(other, timers[other], now)
+        for other in sorted(timers, key=lambda key: timers[key]["created"])
+        if other != name
+    ]
+    if others:
+        output["tooltip"] = "\n".join([output["tooltip"], *others])
+    return output, next_change
+
+
 # ----------------------------------------------------------------------
 # Main loop
 # ----------------------------------------------------------------------
-last_output = None
-
-while True:
+def main():
+    watcher = StateWatcher(STATE_FILE)
+    control = open_control_socket()
     state = load_state()
+    heap = schedule(state)
+    last_output = None
 
-    has_duration = bool(state.get("duration"))
-    is_paused = state.get("paused_at") is not None
-    is_running_state = "start_time" in state and state.get("paused_at") is None
-
-    just_finished = False
-    if is_running_state:
-        elapsed = (
-            datetime.now(timezone.utc) - datetime.fromisoformat(state["start_time"])
-        ).total_seconds()
-        if elapsed >= state["duration"]:
-            just_finished = True
-
-    # Dispatch
-    if not has_duration:
-        output = case_no_timer()
-    elif just_finished:
-        output = case_finished()
-    elif is_paused:
-        output = case_paused(state)
-    elif is_running_state:
-        output = case_running(state)
-    else:
-        output = {"text": "Timer ?", "class": "error"}  # corrupted
-
-    # Print only on change
-    output_json = json.dumps(output)
-    if output_json != last_output:
-        print(output_json)
-        sys.stdout.flush()
-        last_output = output_json
-
-    remaining = 0
-    if is_running_state:
-        elapsed = (
-            datetime.now(timezone.utc) - datetime.fromisoformat(state["start_time"])
-        ).total_seconds()
-        remaining = max(0, int(state["duration"] - elapsed))
-    sleep_time = 1
-    time.sleep(sleep_time)
+    while True:
+        output, next_change = evaluate(state, heap, time.time())
+
+        # Print only on change
+        output_json = json.dumps(output)
+        if output_json != last_output:
+            print(output_json)
+            sys.stdout.flush()
+            last_output = output_json
+
+        timeout = None
+        if next_change is not None:
+            timeout = max(0.0, next_change - time.time())
+        ready, _, _ = select.select([watcher, control], [], [], timeout)
+        if control in ready:
+            before = set_timer.finish_times(state)
+            if apply_commands(control, state):
+                set_timer.save_state(state)
+                set_timer.sync_alarms(before, set_timer.finish_times(state))
+                heap = schedule(state)
+        if watcher in ready and watcher.changed():
+            state = load_state()
+            heap = schedule(state)
+
+
+if __name__ == "__main__":
+    main()
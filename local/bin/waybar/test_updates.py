@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# Checks for the parts of updates.py that stand in for libalpm: vercmp
+# against pacman's own test vectors, and the tar walk against tarfile.
+import gzip
+import io
+import sys
+import tarfile
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import updates
+
+# pacman's test/util/vercmptest.sh; each pair is also checked reversed.
+VERCMP_VECTORS = [
+    # all similar length, no pkgrel
+    ("1.5.0", "1.5.0", 0),
+    ("1.5.1", "1.5.0", 1),
+    # mixed length
+    ("1.5.1", "1.5", 1),
+    # with pkgrel, simple
+    ("1.5.0-1", "1.5.0-1", 0),
+    ("1.5.0-1", "1.5.0-2", -1),
+    ("1.5.0-1", "1.5.1-1", -1),
+    ("1.5.0-2", "1.5.1-1", -1),
+    # with pkgrel, mixed lengths
+    ("1.5-1", "1.5.1-1", -1),
+    ("1.5-2", "1.5.1-1", -1),
+    ("1.5-2", "1.5.1-2", -1),
+    # mixed pkgrel inclusion
+    ("1.5", "1.5-1", 0),
+    ("1.5-1", "1.5", 0),
+    ("1.1-1", "1.1", 0),
+    ("1.0-1", "1.1", -1),
+    ("1.1-1", "1.0", 1),
+    # alphanumeric versions
+    ("1.5b-1", "1.5-1", -1),
+    ("1.5b", "1.5", -1),
+    ("1.5b-1", "1.5", -1),
+    ("1.5b", "1.5.1", -1),
+    # from the manpage
+    ("1.0a", "1.0alpha", -1),
+    ("1.0alpha", "1.0b", -1),
+    ("1.0b", "1.0beta", -1),
+    ("1.0beta", "1.0rc", -1),
+    ("1.0rc", "1.0", -1),
+    # going crazy? alpha-dotted versions
+    ("1.5.a", "1.5", 1),
+    ("1.5.b", "1.5.a", 1),
+    ("1.5.1", "1.5.b", 1),
+    # alpha dots and dashes
+    ("1.5.b-1", "1.5.b", 0),
+    ("1.5-1", "1.5.b", -1),
+    # same/similar content, differing separators
+    ("2.0", "2_0", 0),
+    ("2.0_a", "2_0.a", 0),
+    ("2.0a", "2.0.a", -1),
+    ("2___a", "2_a", 1),
+    # epoch included version comparisons
+    ("0:1.0", "0:1.0", 0),
+    ("0:1.0", "0:1.1", -1),
+    ("1:1.0", "0:1.0", 1),
+    ("1:1.0", "0:1.1", 1),
+    ("1:1.0", "2:1.1", -1),
+    # epoch + sometimes present pkgrel
+    ("1:1.0", "0:1.0-1", 1),
+    ("1:1.0-1", "0:1.1-1", 1),
+    # epoch included on one version
+    ("0:1.0", "1.0", 0),
+    ("0:1.0", "1.1", -1),
+    ("0:1.1", "1.0", 1),
+    ("1:1.0", "1.0", 1),
+    ("1:1.0", "1.1", 1),
+    ("1:1.1", "1.1", 1),
+]
+
+
+def make_tar(members: dict[str, bytes | None], fmt) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w", format=fmt) as tar:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            if data is None:
+                info.type = tarfile.DIRTYPE
+                tar.addfile(info)
+            else:
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def desc(**fields) -> bytes:
+    return "".join(f"%{key}%\n{value}\n\n" for key, value in fields.items()).encode()
+
+
+TAR_MEMBERS = {
+    "core-1.0-1/": None,
+    "core-1.0-1/desc": desc(NAME="core", VERSION="1.0-1"),
+    # Past the 100 byte name field: split into the ustar prefix, a GNU
+    # long name or a pax path record, depending on the format.
+    "d" * 90 + "/" + "n" * 60 + "-1.0-1/desc": b"long",
+    "x" * 140: b"no directory to split at",
+    "ünïcode-2-1/desc": b"pax only",
+    "empty-1-1/desc": b"",
+}
+INSTALLED = {
+    "foo": {"VERSION": "1.0-1", "SIZE": "100"},
+    "bar": {"VERSION": "2.0-1", "SIZE": "100"},
+}
+
+
+class VercmpTest(unittest.TestCase):
+    def test_pacman_vectors(self):
+        for a, b, expected in VERCMP_VECTORS:
+            with self.subTest(a=a, b=b):
+                self.assertEqual(updates.vercmp(a, b), expected)
+                self.assertEqual(updates.vercmp(b, a), -expected)
+
+
+class TarEntriesTest(unittest.TestCase):
+    def assert_matches_tarfile(self, data: bytes):
+        with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+            expected = [
+                (
+                    member.name,
+                    tar.extractfile(member).read() if member.isfile() else b"",
+                )
+                for member in tar.getmembers()
+            ]
+        entries = [
+            (path.rstrip("/"), data[start:end])
+            for path, start, end in updates.tar_entries(data)
+        ]
+        self.assertEqual(entries, expected)
+
+    def test_pax(self):
+        self.assert_matches_tarfile(make_tar(TAR_MEMBERS, tarfile.PAX_FORMAT))
+
+    def test_gnu(self):
+        members = {k: v for k, v in TAR_MEMBERS.items() if k.isascii()}
+        self.assert_matches_tarfile(make_tar(members, tarfile.GNU_FORMAT))
+
+    def test_ustar(self):
+        members = {
+            k: v for k, v in TAR_MEMBERS.items() if k.isascii() and "x" * 140 != k
+        }
+        self.assert_matches_tarfile(make_tar(members, tarfile.USTAR_FORMAT))
+
+    def test_truncated(self):
+        data = make_tar(TAR_MEMBERS, tarfile.PAX_FORMAT)
+        for end in (1024, 1500, len(data) - 10240):
+            with self.subTest(end=end), self.assertRaises(ValueError):
+                list(updates.tar_entries(data[:end]))
+
+
+class ReadSyncTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.db = Path(tmp.name)
+        (self.db / "sync").mkdir()
+        patcher = mock.patch.object(updates, "CHECKUPDATES_DB", self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write_repo(self, repo, data: bytes):
+        (self.db / "sync" / f"{repo}.db").write_bytes(data)
+
+    def repo_tar(self) -> bytes:
+        return make_tar(
+            {
+                "foo-1.1-1/desc": desc(NAME="foo", CSIZE="10", ISIZE="150"),
+                "bar-2.0-1/desc": desc(NAME="bar"),
+                "baz-1.0-1/desc": desc(NAME="baz"),
+            },
+            tarfile.PAX_FORMAT,
+        )
+
+    def test_newer_versions_only(self):
+        self.write_repo("core", gzip.compress(self.repo_tar()))
+        seen = set()
+        found = updates.read_sync("core", INSTALLED, seen)
+        self.assertEqual(
+            found,
+            [
+                {
+                    "name": "foo",
+                    "repo": "core",
+                    "old": "1.0-1",
+                    "new": "1.1-1",
+                    "download": 10,
+                    "delta": 50,
+                }
+            ],
+        )
+        self.assertEqual(seen, {"foo", "bar"})
+
+    def test_unreadable(self):
+        data = gzip.compress(self.repo_tar())
+        bad_crc = bytearray(data)
+        bad_crc[-8] ^= 0xFF
+        for name, body in (
+            ("truncated", data[: len(data) // 2]),
+            ("bad crc", bytes(bad_crc)),
+            ("unknown compression", b"\x00" * 1024),
+            ("short tar", gzip.compress(self.repo_tar()[:1000])),
+        ):
+            with self.subTest(name):
+                self.write_repo("core", body)
+                seen = set()
+                self.assertIsNone(updates.read_sync("core", INSTALLED, seen))
+                self.assertEqual(seen, set())
+        self.assertIsNone(updates.read_sync("missing", INSTALLED, set()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,43 +1,380 @@
 #!/usr/bin/env python3
+import bz2
+import ctypes
+import ctypes.util
+import gzip
+import lzma
 import subprocess
 import json
 import os
+import re
+import select
+import struct
+import sys
 import time
+from pathlib import Path
+
+try:
+    from compression import zstd  # Python 3.14+
+except ImportError:
+    zstd = None
+
+# checkupdates keeps its copy of the sync databases here; a persistent
+# directory means pacman -Sy only fetches the repos that changed.
+CHECKUPDATES_DB = Path.home() / ".cache" / "checkupdates-db"
+PACMAN_DIR = Path("/var/lib/pacman")
+PACMAN_CONF = Path("/etc/pacman.conf")
+LOCKS = [PACMAN_DIR / "db.lck", CHECKUPDATES_DB / "db.lck"]
+INTERVAL = 1800  # recount this often even without local changes
+LOCK_TIMEOUT = 600
+SETTLE = 2  # quiet seconds after a package change before recounting
+
+# inotify(7)
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_MOVED_TO = 0x080
+EVENT_HEADER = struct.Struct("iIII")
+
+# Repo databases are tarballs; zstd ones can only be read on Python 3.14+
+# and show up in the tooltip as unreadable before that.
+DECOMPRESSORS = {
+    b"\x1f\x8b": gzip.decompress,
+    b"\xfd7zXZ": lzma.decompress,
+    b"BZh": bz2.decompress,
+}
+# What a truncated or corrupt database raises on the way through
+# decompression, tar_entries and the desc parser.
+UNPACK_ERRORS = (OSError, EOFError, ValueError, lzma.LZMAError)
+if zstd:
+    DECOMPRESSORS[b"\x28\xb5\x2f\xfd"] = zstd.decompress
+    UNPACK_ERRORS += (zstd.ZstdError,)
 
 KEYWORDS = ["linux-", "python-", "nvidia-", "fuse", "systemd"]
+FLAGGED = re.compile("|".join(map(re.escape, KEYWORDS))).search
 MAX_TOOLTIP_LINES = 24
 THRESHOLD = 10
 THRESHOLD_YELLOW = 20
 THRESHOLD_RED = 50
 
 
-def check_lock_files():
-    pacman_lock = "/var/lib/pacman/db.lck"
-    checkup_lock = f"{os.getenv('TMPDIR', '/tmp')}/checkup-db-{os.getuid()}/db.lck"
-    while os.path.exists(pacman_lock) or os.path.exists(checkup_lock):
-        time.sleep(1)
+class Inotify:
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
 
+    def add(self, path: Path, mask: int) -> int:
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed: {path}")
+        return wd
 
-def get_updates():
+    def fileno(self) -> int:
+        return self.fd
+
+    def read(self) -> set[int]:
+        # Drain pending events; returns the watch descriptors they hit.
+        hit = set()
+        while True:
+            try:
+                data = os.read(self.fd, 4096)
+            except BlockingIOError:
+                return hit
+            pos = 0
+            while pos < len(data):
+                wd, _, _, length = EVENT_HEADER.unpack_from(data, pos)
+                pos += EVENT_HEADER.size + length
+                hit.add(wd)
+
+
+def wait_for_locks(watcher: Inotify, timeout: float) -> bool:
+    # Both lock directories are watched for deletions, so this wakes when
+    # a lock goes away instead of polling for it.
+    deadline = time.monotonic() + timeout
+    while any(lock.exists() for lock in LOCKS):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        select.select([watcher], [], [], remaining)
+        watcher.read()
+    return True
+
+
+def wait_for_change(watcher: Inotify, local_wd: int, timeout: float):
+    # Returns when the installed packages change (once events settle) or
+    # after timeout.
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        ready, _, _ = select.select([watcher], [], [], remaining)
+        if ready and local_wd in watcher.read():
+            break
+    while select.select([watcher], [], [], SETTLE)[0]:
+        watcher.read()
+
+
+def parse_desc(text: str) -> dict[str, str]:
+    # A desc entry is blocks of "%FIELD%" followed by its value lines; only
+    # the first value of each field is needed here.
+    fields = {}
+    lines = iter(text.splitlines())
+    for line in lines:
+        if line.startswith("%") and line.endswith("%"):
+            fields[line[1:-1]] = next(lines, "")
+    return fields
+
+
+def rpmvercmp(a: str, b: str) -> int:
+    # Port of libalpm's rpmvercmp: alternating numeric and alphabetic
+    # segments, numeric beats alpha, and a trailing alpha segment is older.
+    if a == b:
+        return 0
+    i = j = 0
+    while i < len(a) and j < len(b):
+        start_a, start_b = i, j
+        while i < len(a) and not (a[i].isascii() and a[i].isalnum()):
+            i += 1
+        while j < len(b) and not (b[j].isascii() and b[j].isalnum()):
+            j += 1
+        if i >= len(a) or j >= len(b):
+            break
+        if i - start_a != j - start_b:
+            return -1 if i - start_a < j - start_b else 1
+        start_a, start_b = i, j
+        if a[i].isdigit():
+            while i < len(a) and a[i].isascii() and a[i].isdigit():
+                i += 1
+            while j < len(b) and b[j].isascii() and b[j].isdigit():
+                j += 1
+            numeric = True
+        else:
+            while i < len(a) and a[i].isascii() and a[i].isalpha():
+                i += 1
+            while j < len(b) and b[j].isascii() and b[j].isalpha():
+                j += 1
+            numeric = False
+        seg_a, seg_b = a[start_a:i], b[start_b:j]
+        if not seg_b:
+            return 1 if numeric else -1
+        if numeric:
+            seg_a, seg_b = seg_a.lstrip("0"), seg_b.lstrip("0")
+            if len(seg_a) != len(seg_b):
+                return 1 if len(seg_a) > len(seg_b) else -1
+        if seg_a != seg_b:
+            return 1 if seg_a > seg_b else -1
+    rest_a, rest_b = a[i:], b[j:]
+    if not rest_a and not rest_b:
+        return 0
+    if (not rest_a and not rest_b[0].isalpha()) or (rest_a and rest_a[0].isalpha()):
+        return -1
+    return 1
+
+
+def split_evr(version: str) -> tuple[str, str, str | None]:
+    epoch, sep, rest = version.partition(":")
+    if not sep or not epoch.isdigit():
+        epoch, rest = "0", version
+    ver, sep, rel = rest.rpartition("-")
+    if not sep:
+        return epoch, rest, None
+    return epoch, ver, rel
+
+
+def vercmp(a: str, b: str) -> int:
+    # Same ordering as pacman's vercmp(8): epoch, then version, then pkgrel
+    # when both sides have one.
+    if a == b:
+        return 0
+    epoch_a, ver_a, rel_a = split_evr(a)
+    epoch_b, ver_b, rel_b = split_evr(b)
+    result = rpmvercmp(epoch_a, epoch_b) or rpmvercmp(ver_a, ver_b)
+    if result == 0 and rel_a and rel_b:
+        result = rpmvercmp(rel_a, rel_b)
+    return result
+
+
+def read_local() -> dict[str, dict[str, str]]:
+    installed = {}
+    for entry in (PACMAN_DIR / "local").iterdir():
+        try:
+            desc = parse_desc((entry / "desc").read_text())
+        except (NotADirectoryError, FileNotFoundError):
+            continue
+        installed[desc["NAME"]] = desc
+    return installed
+
+
+def sync_repos() -> list[str]:
+    # pacman resolves a package from the first repo that has it, in the
+    # order the repos appear in pacman.conf.
+    repos = []
+    for line in PACMAN_CONF.read_text().splitlines():
+        line = line.strip()
+        if line.startswith("[") and line.endswith("]") and line != "[options]":
+            repos.append(line[1:-1])
+    return repos
+
+
+def tar_entries(data: bytes):
+    # Yields (path, start, end) for each file in an uncompressed tar. A
+    # repo database holds tens of thousands of tiny entries, and building
+    # tarfile's member objects for them costs far more than this walk.
+    pos = 0
+    long_name = None
+    while True:
+        # The archive ends with a zero block; running out first means it
+        # was cut short.
+        if pos + 512 > len(data):
+            raise ValueError("truncated tar archive")
+        if not data[pos]:
+            return
+        header = data[pos : pos + 512]
+        name = header[:100].split(b"\0", 1)[0]
+        if header[257:262] == b"ustar" and header[345]:
+            name = header[345:500].split(b"\0", 1)[0] + b"/" + name
+        size = int(header[124:136].split(b"\0", 1)[0].strip() or b"0", 8)
+        kind = header[156:157]
+        start = pos + 512
+        if start + size > len(data):
+            raise ValueError("truncated tar archive")
+        pos = start + (size + 511) // 512 * 512
+        if kind == b"L":  # GNU long name for the next entry
+            long_name = data[start : start + size].split(b"\0", 1)[0]
+        elif kind == b"x":  # pax header; only its path record matters
+            for record in data[start : start + size].split(b"\n"):
+                _, _, field = record.partition(b" ")
+                if field.startswith(b"path="):
+                    long_name = field[5:]
+        elif kind != b"g":
+            yield (long_name or name).decode(), start, start + size
+            long_name = None
+
+
+def read_sync(repo: str, installed: dict, seen: set[str]) -> list[dict] | None:
+    # None when the database is missing or can't be unpacked; its packages
+    # are then left for the repos after it, as if it weren't there.
     try:
-        output = subprocess.check_output(
-            ["checkupdates"], text=True, stderr=subprocess.DEVNULL
+        data = (CHECKUPDATES_DB / "sync" / f"{repo}.db").read_bytes()
+        for magic, decompress in DECOMPRESSORS.items():
+            if data.startswith(magic):
+                data = decompress(data)
+                break
+        else:
+            if data[257:262] != b"ustar":
+                return None
+        found = set()
+        updates = sync_updates(repo, data, installed, seen, found)
+    except UNPACK_ERRORS:
+        return None
+    seen.update(found)
+    return updates
+
+
+def sync_updates(repo, data, installed, seen, found) -> list[dict]:
+    # Entry directories are named "<name>-<pkgver>-<pkgrel>", so only the
+    # desc files of packages whose version differs from the installed one
+    # are parsed.
+    updates = []
+    for path, start, end in tar_entries(data):
+        entry, _, filename = path.partition("/")
+        if filename != "desc":
+            continue
+        name, version, rel = entry.rsplit("-", 2)
+        local = installed.get(name)
+        if local is None or name in seen or name in found:
+            continue
+        found.add(name)
+        new_version = f"{version}-{rel}"
+        if new_version == local["VERSION"]:
+            continue
+        if vercmp(new_version, local["VERSION"]) <= 0:
+            continue
+        desc = parse_desc(data[start:end].decode())
+        updates.append(
+            {
+                "name": name,
+                "repo": repo,
+                "old": local["VERSION"],
+                "new": new_version,
+                "download": int(desc.get("CSIZE", 0)),
+                "delta": int(desc.get("ISIZE", 0)) - int(local.get("SIZE", 0)),
+            }
         )
-        return [line.split()[0] for line in output.splitlines()]
-    except subprocess.CalledProcessError:
-        return []
+    return updates
+
+
+def sync_databases() -> bool:
+    # What checkupdates does before its pacman -Qu: a private copy of the
+    # sync databases next to a link to the real local one.
+    local = CHECKUPDATES_DB / "local"
+    if not local.is_symlink():
+        local.symlink_to(PACMAN_DIR / "local")
+    result = subprocess.run(
+        [
+            "fakeroot",
+            "--",
+            "pacman",
+            "-Sy",
+            "--dbpath",
+            str(CHECKUPDATES_DB),
+            "--logfile",
+            "/dev/null",
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        check=False,
+    )
+    return result.returncode == 0
+
+
+def get_updates():
+    sync_databases()
+    installed = read_local()
+    seen = set()
+    updates = []
+    unreadable = []
+    for repo in sync_repos():
+        repo_updates = read_sync(repo, installed, seen)
+        if repo_updates is None:
+            unreadable.append(repo)
+        else:
+            updates.extend(repo_updates)
+    return updates, unreadable
+
 
+def format_size(size: int) -> str:
+    return f"{size / 1_048_576:.1f} MiB"
 
-def generate_tooltip(packages, max_lines, keywords):
-    tooltip_lines = []
+
+def generate_tooltip(packages, max_lines, flagged, unreadable=()):
+    # Updates in these repos aren't counted, so say so before the rest.
+    tooltip_lines = [f"{repo}: database unreadable" for repo in unreadable]
+    shown = 0
+    by_repo = {}
     for pkg in packages:
-        if any(kw in pkg for kw in keywords):
-            continue
-        if len(tooltip_lines) < max_lines:
-            tooltip_lines.append(f"•{pkg}")
-    remaining = len(packages) - len(tooltip_lines)
+        by_repo.setdefault(pkg["repo"], []).append(pkg)
+    for repo, pkgs in by_repo.items():
+        if shown >= max_lines:
+            break
+        tooltip_lines.append(f"{repo} ({len(pkgs)})")
+        # Flagged packages first, marked with "!" instead of the bullet.
+        pkgs.sort(key=lambda pkg: (not flagged(pkg["name"]), pkg["name"]))
+        for pkg in pkgs[: max_lines - shown]:
+            mark = "!" if flagged(pkg["name"]) else "•"
+            tooltip_lines.append(f"{mark}{pkg['name']} {pkg['old']} → {pkg['new']}")
+        shown += min(len(pkgs), max_lines - shown)
+    remaining = len(packages) - shown
     if remaining > 0:
         tooltip_lines.append(f"+{remaining} more")
+    download = sum(pkg["download"] for pkg in packages)
+    delta = sum(pkg["delta"] for pkg in packages)
+    sign = "+" if delta >= 0 else "-"
+    tooltip_lines.append(
+        f"↓{format_size(download)}  installed {sign}{format_size(abs(delta))}"
+    )
     return "\n".join(tooltip_lines)
 
 
@@ -50,25 +387,39 @@ def get_css_class(updates):
     return css_class
 
 
-def main():
-    check_lock_files()
-    packages = get_updates()
+def render(packages, unreadable=()):
     updates = len(packages)
-    if updates < THRESHOLD:
-        print(json.dumps({"text": ""}))
-        return
+    # An unreadable repo may be hiding updates, so don't hide the module.
+    if updates < THRESHOLD and not unreadable:
+        return {"text": ""}
     css_class = get_css_class(updates)
-    tooltip = generate_tooltip(packages, MAX_TOOLTIP_LINES, KEYWORDS)
-    print(
-        json.dumps(
-            {
-                "text": str(updates),
-                "alt": str(updates),
-                "tooltip": tooltip or "Click to update",
-                "class": css_class,
-            }
-        )
-    )
+    tooltip = generate_tooltip(packages, MAX_TOOLTIP_LINES, FLAGGED, unreadable)
+    return {
+        "text": str(updates),
+        "alt": str(updates),
+        "tooltip": tooltip or "Click to update",
+        "class": css_class,
+    }
+
+
+def main():
+    # Stays resident under waybar: recounts every INTERVAL, and right after
+    # pacman installs or removes anything.
+    CHECKUPDATES_DB.mkdir(parents=True, exist_ok=True)
+    watcher = Inotify()
+    for lock in LOCKS:
+        watcher.add(lock.parent, IN_DELETE)
+    local_wd = watcher.add(PACMAN_DIR / "local", IN_CREATE | IN_DELETE | IN_MOVED_TO)
+    while True:
+        wait_for_locks(watcher, LOCK_TIMEOUT)
+        try:
+            output = render(*get_updates())
+        except Exception as error:
+            # Keep the last count on the bar and try again at the next wake.
+            print(f"updates: {error!r}", file=sys.stderr)
+        else:
+            print(json.dumps(output), flush=True)
+        wait_for_change(watcher, local_wd, INTERVAL)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import timeit
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+FIXTURE = HERE / "fixtures" / "forecast.bin"
+AIR_FIXTURE = HERE / "fixtures" / "air_quality.bin"
+GOLDEN = HERE / "fixtures" / "render.json"
+# 3h15m apart, so the window starts on odd and even hours at varying minutes.
+GOLDEN_STEP = 11700
+GOLDEN_STEPS = 8
+COLD_IMPORTS = ("main", "openmeteo_requests")
+
+sys.path.insert(0, str(HERE))
+import main as weather
+
+
+class ReplayClient:
+    # Stand-in for openmeteo_requests.Client: answers weather_api() from
+    # recorded FlatBuffers bodies keyed by URL, so the decode path runs
+    # without a network.
+    def __init__(self, bodies: dict[str, bytes]):
+        self.bodies = bodies
+
+    def weather_api(self, url, params, **kwargs):
+        from openmeteo_sdk.WeatherApiResponse import WeatherApiResponse
+
+        body = self.bodies[url]
+        responses = []
+        pos = 0
+        while pos < len(body):
+            length = int.from_bytes(body[pos : pos + 4], "little")
+            responses.append(WeatherApiResponse.GetRootAs(body, pos + 4))
+            pos += length + 4
+        return responses
+
+
+def record(fixtures: dict[str, Path]):
+    import requests
+
+    params = {
+        weather.FORECAST_URL: weather.forecast_params(weather.LOCATIONS),
+        weather.AIR_QUALITY_URL: weather.air_quality_params(weather.LOCATIONS),
+    }
+    for url, path in fixtures.items():
+        params[url]["format"] = "flatbuffers"
+        response = requests.get(url, params=params[url], timeout=30)
+        response.raise_for_status()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(response.content)
+        print(f"recorded {len(response.content)} bytes to {path}")
+
+
+def golden_tooltips(bodies: dict[str, bytes]) -> dict[str, dict[str, str]]:
+    # The first location's tooltip in both units at GOLDEN_STEPS render
+    # times from the fixture's own time on, without the air line, which is
+    # what the pre-NumPy renderer drew. test_main.py checks it against
+    # fixtures/render.json.
+    client = ReplayClient(bodies)
+    start = client.weather_api(weather.FORECAST_URL, params={})[0].Current().Time()
+    forecast = weather.open_meteo(weather.LOCATIONS[:1], client=client)[0]
+    forecast.pop("air", None)
+    return {
+        str(now): {
+            units: weather.location_tooltip(weather.LOCATIONS[0], forecast, metric, now)
+            for units, metric in (("imperial", False), ("metric", True))
+        }
+        for now in range(start, start + GOLDEN_STEPS * GOLDEN_STEP, GOLDEN_STEP)
+    }
+
+
+def peak_rss_kib() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def cold_import(module: str, runs: int) -> dict:
+    # A fresh interpreter per run, so nothing is already in sys.modules.
+    code = (
+        "import resource, sys, time\n"
+        f"sys.path.insert(0, {str(HERE)!r})\n"
+        "start = time.perf_counter()\n"
+        f"import {module}\n"
+        "elapsed = time.perf_counter() - start\n"
+        "rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss\n"
+        "print(elapsed, rss)\n"
+    )
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        ).stdout.split()
+        samples.append((float(out[0]), int(out[1])))
+    seconds = [elapsed for elapsed, _ in samples]
+    return {
+        "min_ms": min(seconds) * 1e3,
+        "median_ms": statistics.median(seconds) * 1e3,
+        "peak_rss_kib": max(rss for _, rss in samples),
+    }
+
+
+def time_stage(fn, repeat: int) -> dict:
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    per_call = [total / number for total in timer.repeat(repeat=repeat, number=number)]
+    return {
+        "min_us": min(per_call) * 1e6,
+        "median_us": statistics.median(per_call) * 1e6,
+        "peak_rss_kib": peak_rss_kib(),
+    }
+
+
+def run_stages(bodies: dict[str, bytes], metric: bool, repeat: int) -> dict:
+    client = ReplayClient(bodies)
+    responses = client.weather_api(weather.FORECAST_URL, params={})
+    response = responses[0]
+    air_response = client.weather_api(weather.AIR_QUALITY_URL, params={})[0]
+    # The fixture's current block is stamped with the time it was recorded,
+    # so the tooltip window lines up with the recorded hours on every run.
+    now = response.Current().Time()
+    # A fixture recorded with several locations holds one response for each.
+    locations = weather.LOCATIONS[: len(responses)]
+    tz = locations[0]["timezone"]
+    forecasts = weather.open_meteo(locations, client=client)
+    frames = forecasts[0]
+
+    hourly = weather.add_daytime_flag(
+        frames["hourly"].copy(),
+        frames["daily"].copy(),
+        tz=tz,
+        step=weather.HOURLY_STEP,
+        metric=metric,
+    )
+    hourly = weather.map_icons(hourly, is_hourly=True)
+    daily = weather.map_icons(frames["daily"].copy())
+
+    stages = {
+        "parse": lambda: client.weather_api(weather.FORECAST_URL, params={}),
+        "df_daily": lambda: weather.df_daily(response),
+        "df_hourly": lambda: weather.df_hourly(response),
+        "df_current": lambda: weather.df_current(response),
+        "df_air": lambda: weather.df_air(air_response),
+        "open_meteo": lambda: weather.open_meteo(locations, client=client),
+        "add_daytime_flag": lambda: weather.add_daytime_flag(
+            frames["hourly"].copy(),
+            frames["daily"].copy(),
+            tz=tz,
+            step=weather.HOURLY_STEP,
+            metric=metric,
+        ),
+        "map_icons": lambda: (
+            weather.map_icons(hourly.copy(), is_hourly=True),
+            weather.map_icons(frames["daily"].copy()),
+        ),
+        "build_tooltip": lambda: weather.build_tooltip(
+            daily,
+            hourly,
+            my_zone=tz,
+            celsius=metric,
+            hourly_step=weather.HOURLY_STEP,
+            now=now,
+        ),
+        "render": lambda: weather.render(
+            forecasts, metric, now=now, locations=locations
+        ),
+    }
+    return {name: time_stage(fn, repeat) for name, fn in stages.items()}
+
+
+def git_revision() -> str:
+    result = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"],
+        cwd=HERE,
+        check=False,
+        capture_output=True,
+        text=True,
+    )
+    return result.stdout.strip() or "unknown"
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for section, key in (("cold_import", "min_ms"), ("stages", "min_us")):
+        for name, now in results[section].items():
+            before = baseline.get(section, {}).get(name)
+            if not before:
+                continue
+            ratio = now[key] / before[key]
+            now["vs_baseline"] = round(ratio, 3)
+            if ratio > 1 + tolerance:
+                regressions.append(f"{section}.{name}: {ratio:.2f}x")
+    return regressions
+
+
+def print_table(results: dict):
+    print(
+        f"weather bench @ {results['revision']} "
+        f"(python {results['python']}, numpy {results['numpy']}, "
+        f"metric {results['metric']})"
+    )
+    print(f"{'cold import':<18}{'min ms':>10}{'median ms':>12}{'rss KiB':>10}")
+    for name, row in results["cold_import"].items():
+        ratio = f"{row['vs_baseline']:>8.2f}x" if "vs_baseline" in row else ""
+        print(
+            f"{name:<18}{row['min_ms']:>10.1f}{row['median_ms']:>12.1f}"
+            f"{row['peak_rss_kib']:>10}{ratio}"
+        )
+    print(f"{'stage':<18}{'min us':>10}{'median us':>12}{'rss KiB':>10}")
+    for name, row in results["stages"].items():
+        ratio = f"{row['vs_baseline']:>8.2f}x" if "vs_baseline" in row else ""
+        print(
+            f"{name:<18}{row['min_us']:>10.1f}{row['median_us']:>12.1f}"
+            f"{row['peak_rss_kib']:>10}{ratio}"
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the weather module offline against a recorded forecast."
+    )
+    parser.add_argument("--fixture", type=Path, default=FIXTURE)
+    parser.add_argument("--air-fixture", type=Path, default=AIR_FIXTURE)
+    parser.add_argument(
+        "--record",
+        action="store_true",
+        help="Fetch a fresh response into the fixture instead of benchmarking",
+    )
+    parser.add_argument(
+        "--update-golden",
+        action="store_true",
+        help="Rewrite the golden file test_main.py checks from the current renderer",
+    )
+    parser.add_argument("--golden", type=Path, default=GOLDEN)
+    parser.add_argument("--metric", action="store_true")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--import-runs", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        help="JSON results from an earlier run; exit 1 if a stage got slower",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.5,
+        help="Allowed slowdown against --baseline (0.5 = 50%%)",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    fixtures = {
+        weather.FORECAST_URL: args.fixture,
+        weather.AIR_QUALITY_URL: args.air_fixture,
+    }
+    if args.record:
+        record(fixtures)
+        return
+    if args.update_golden:
+        bodies = {url: path.read_bytes() for url, path in fixtures.items()}
+        tooltips = golden_tooltips(bodies)
+        args.golden.write_text(
+            json.dumps(tooltips, indent=2, ensure_ascii=False) + "\n"
+        )
+        print(f"wrote {args.golden}")
+        return
+    import numpy as np
+
+    results = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "metric": args.metric,
+        "fixture": args.fixture.name,
+        "cold_import": {
+            module: cold_import(module, args.import_runs) for module in COLD_IMPORTS
+        },
+        "stages": run_stages(
+            {url: path.read_bytes() for url, path in fixtures.items()},
+            args.metric,
+            args.repeat,
+        ),
+        "peak_rss_kib": peak_rss_kib(),
+    }
+    regressions = []
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        regressions = compare(results, baseline, args.tolerance)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
+        print(f"peak RSS {results['peak_rss_kib']} KiB")
+    for regression in regressions:
+        print(f"regression: {regression}", file=sys.stderr)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
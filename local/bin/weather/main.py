@@ -1,13 +1,14 @@
 #!/usr/bin/env python3
 import argparse
 import json
-import pandas as pd
+import math
+import os
+import signal
+import time
+import numpy as np
+from datetime import datetime
 from pathlib import Path
 from zoneinfo import ZoneInfo
-from dataclasses import dataclass
-import openmeteo_requests
-import requests_cache
-from retry_requests import retry
 
 WEATHER_ICONS = {
     0: ("clear", "", ""),
@@ -84,80 +85,135 @@ WEATHER_ICONS = {
     99: ("thunderstorm_hail", "󰖒", ""),
 }
 FALLBACK_ICON = ("unknown", "", "")
-LATITUDE = 34.1751
-LONGITUDE = -82.024
+# Fetched together in one batched request; the bar shows the first entry.
+LOCATIONS = [
+    {
+        "name": "Home",
+        "latitude": 34.1751,
+        "longitude": -82.024,
+        "timezone": "America/New_York",
+    },
+]
 HOURLY_STEP = 2
-TIMEZONE = "America/New_York"
+FORECAST_DAYS = 7
+FORECAST_HOURS = 24
 CACHE_FILE = Path(".metric_cache")
+CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "weather"
+SNAPSHOT_TTL = 3600
+# Extra hourly data past the visible window: a snapshot can be rendered up to
+# SNAPSHOT_TTL after it was fetched, and longer while refreshes keep failing.
+FORECAST_SLACK_HOURS = math.ceil(SNAPSHOT_TTL / 3600) + 6
+RENDER_INTERVAL = 600
+FETCH_RETRY = 300
+FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+AIR_QUALITY_URL = "https://air-quality-api.open-meteo.com/v1/air-quality"
+# Requested as the "current" block of the air-quality API, in this order.
+# Pollen is only modelled for Europe; elsewhere the API returns NaN.
+AIR_VARIABLES = (
+    "us_aqi",
+    "uv_index",
+    "alder_pollen",
+    "birch_pollen",
+    "grass_pollen",
+    "ragweed_pollen",
+)
+AQI_LEVELS = (
+    (50, "Good"),
+    (100, "Moderate"),
+    (150, "Unhealthy for sensitive groups"),
+    (200, "Unhealthy"),
+    (300, "Very unhealthy"),
+)
+
+# Frames are plain dicts mapping column names to equal-length NumPy arrays.
+# Timestamps are UTC epoch seconds. A forecast holds one frame per Open-Meteo
+# block: "daily", "hourly" and a single-row "current".
+Frame = dict[str, np.ndarray]
+Forecast = dict[str, Frame]
+
+
+def col(frame: Frame, name: str) -> np.ndarray:
+    return np.asarray(frame[name])
+
+
+def time_axis(block) -> np.ndarray:
+    return np.arange(block.Time(), block.TimeEnd(), block.Interval(), dtype=np.int64)
+
+
+def local_offsets(epochs: np.ndarray, zone: ZoneInfo) -> np.ndarray:
+    def offset(epoch) -> int:
+        return int(datetime.fromtimestamp(int(epoch), zone).utcoffset().total_seconds())
+
+    if len(epochs) == 0:
+        return np.zeros(0, dtype=np.int64)
+    first, last = offset(epochs[0]), offset(epochs[-1])
+    if first == last:
+        return np.full(len(epochs), first, dtype=np.int64)
+    return np.array([offset(epoch) for epoch in epochs], dtype=np.int64)
+
+
+def clock_strings(epochs: np.ndarray, zone: ZoneInfo) -> np.ndarray:
+    minutes = (epochs + local_offsets(epochs, zone)) % 86400 // 60
+    hours, minutes = np.divmod(minutes, 60)
+    return np.array(
+        [f"{h:02d}:{m:02d}" for h, m in zip(hours.tolist(), minutes.tolist())],
+        dtype=object,
+    )
 
 
-def open_meteo(lat, lon):
-    def create_retry_session():
-        cache_session = requests_cache.CachedSession(".cache", expire_after=3600)
-        retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
-        return retry_session
-
-    def df_daily(response):
-        daily = response.Daily()
-        daily_weather_code = daily.Variables(0).ValuesAsNumpy()
-        daily_precipitation_sum = daily.Variables(1).ValuesAsNumpy()
-        daily_sunrise = daily.Variables(2).ValuesInt64AsNumpy()
-        daily_sunset = daily.Variables(3).ValuesInt64AsNumpy()
-        daily_temperature_2m_max = daily.Variables(4).ValuesAsNumpy()
-        daily_temperature_2m_min = daily.Variables(5).ValuesAsNumpy()
-        daily_precipitation_probability_max = daily.Variables(6).ValuesAsNumpy()
-        daily_data = {
-            "date": pd.date_range(
-                start=pd.to_datetime(
-                    daily.Time() + response.UtcOffsetSeconds(), unit="s", utc=True
-                ),
-                end=pd.to_datetime(
-                    daily.TimeEnd() + response.UtcOffsetSeconds(), unit="s", utc=True
-                ),
-                freq=pd.Timedelta(seconds=daily.Interval()),
-                inclusive="left",
-            )
-        }
-        daily_data["weather_code"] = daily_weather_code
-        daily_data["precipitation_sum"] = daily_precipitation_sum
-        daily_data["sunrise"] = daily_sunrise
-        daily_data["sunset"] = daily_sunset
-        daily_data["temperature_2m_max"] = daily_temperature_2m_max
-        daily_data["temperature_2m_min"] = daily_temperature_2m_min
-        daily_data["precipitation_probability_max"] = (
-            daily_precipitation_probability_max
-        )
-        return pd.DataFrame(data=daily_data)
-
-    def df_hourly(response):
-        hourly = response.Hourly()
-        hourly_temperature_2m = hourly.Variables(0).ValuesAsNumpy()
-        hourly_precipitation_probability = hourly.Variables(1).ValuesAsNumpy()
-        hourly_precipitation = hourly.Variables(2).ValuesAsNumpy()
-        hourly_weather_code = hourly.Variables(3).ValuesAsNumpy()
-        hourly_data = {
-            "date": pd.date_range(
-                start=pd.to_datetime(
-                    hourly.Time() + response.UtcOffsetSeconds(), unit="s", utc=True
-                ),
-                end=pd.to_datetime(
-                    hourly.TimeEnd() + response.UtcOffsetSeconds(), unit="s", utc=True
-                ),
-                freq=pd.Timedelta(seconds=hourly.Interval()),
-                inclusive="left",
-            )
-        }
-        hourly_data["temperature_2m"] = hourly_temperature_2m
-        hourly_data["precipitation_probability"] = hourly_precipitation_probability
-        hourly_data["precipitation"] = hourly_precipitation
-        hourly_data["weather_code"] = hourly_weather_code
-        return pd.DataFrame(data=hourly_data)
-
-    session = create_retry_session()
-    openmeteo = openmeteo_requests.Client(session)
-    params = {
-        "latitude": lat,
-        "longitude": lon,
+def date_strings(epochs: np.ndarray, zone: ZoneInfo) -> list[str]:
+    local = epochs + local_offsets(epochs, zone)
+    days = np.datetime_as_string(local.astype("datetime64[s]"), unit="D")
+    return [day[5:] for day in days.tolist()]
+
+
+def df_daily(response) -> Frame:
+    daily = response.Daily()
+    daily_data = {"date": time_axis(daily)}
+    daily_data["weather_code"] = daily.Variables(0).ValuesAsNumpy()
+    daily_data["precipitation_sum"] = daily.Variables(1).ValuesAsNumpy()
+    daily_data["sunrise"] = daily.Variables(2).ValuesInt64AsNumpy()
+    daily_data["sunset"] = daily.Variables(3).ValuesInt64AsNumpy()
+    daily_data["temperature_2m_max"] = daily.Variables(4).ValuesAsNumpy()
+    daily_data["temperature_2m_min"] = daily.Variables(5).ValuesAsNumpy()
+    daily_data["precipitation_probability_max"] = daily.Variables(6).ValuesAsNumpy()
+    return daily_data
+
+
+def df_hourly(response) -> Frame:
+    hourly = response.Hourly()
+    hourly_data = {"date": time_axis(hourly)}
+    hourly_data["temperature_2m"] = hourly.Variables(0).ValuesAsNumpy()
+    hourly_data["precipitation_probability"] = hourly.Variables(1).ValuesAsNumpy()
+    hourly_data["precipitation"] = hourly.Variables(2).ValuesAsNumpy()
+    hourly_data["weather_code"] = hourly.Variables(3).ValuesAsNumpy()
+    return hourly_data
+
+
+def df_current(response) -> Frame:
+    current = response.Current()
+    return {
+        "date": np.array([current.Time()], dtype=np.int64),
+        "weather_code": np.array([current.Variables(0).Value()], dtype=np.float32),
+        "is_day": np.array([current.Variables(1).Value() == 1]),
+    }
+
+
+def df_air(response) -> Frame:
+    current = response.Current()
+    air_data = {"date": np.array([current.Time()], dtype=np.int64)}
+    for i, name in enumerate(AIR_VARIABLES):
+        air_data[name] = np.array([current.Variables(i).Value()], dtype=np.float32)
+    return air_data
+
+
+def forecast_params(locations) -> dict:
+    # Open-Meteo takes one value per location and answers with one response
+    # per location, in the same order.
+    return {
+        "latitude": [location["latitude"] for location in locations],
+        "longitude": [location["longitude"] for location in locations],
+        "timezone": [location["timezone"] for location in locations],
         "daily": [
             "weather_code",
             "precipitation_sum",
@@ -173,215 +229,386 @@ def open_meteo(lat, lon):
             "precipitation",
             "weather_code",
         ],
-        "timezone": "America/New_York",
-        "wind_speed_unit": "mph",
+        "current": ["weather_code", "is_day"],
+        # The hourly block starts at the current hour; build_tooltip cuts it
+        # back to FORECAST_HOURS from whenever it renders.
+        "forecast_days": FORECAST_DAYS,
+        "forecast_hours": FORECAST_HOURS + FORECAST_SLACK_HOURS,
         "temperature_unit": "fahrenheit",
         "precipitation_unit": "inch",
     }
 
-    def fetch_weather(lat, lon):
-        responses = openmeteo.weather_api(
-            "https://api.open-meteo.com/v1/forecast", params=params
+
+def air_quality_params(locations) -> dict:
+    return {
+        "latitude": [location["latitude"] for location in locations],
+        "longitude": [location["longitude"] for location in locations],
+        "timezone": [location["timezone"] for location in locations],
+        "current": list(AIR_VARIABLES),
+    }
+
+
+def create_retry_session():
+    # The HTTP stack is only imported when the snapshot can't be used.
+    import requests_cache
+    from retry_requests import retry
+
+    now = time.time()
+    cache_session = requests_cache.CachedSession(
+        CACHE_DIR / "http", expire_after=forecast_expiry(now) - now
+    )
+    return retry(cache_session, retries=5, backoff_factor=0.2)
+
+
+def open_meteo(locations, client=None) -> list[Forecast]:
+    from concurrent.futures import ThreadPoolExecutor
+
+    if client is None:
+        import openmeteo_requests
+
+        client = openmeteo_requests.Client(create_retry_session())
+
+    # Both endpoints go out at once over the same session, so a refresh
+    # costs one round trip rather than two.
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        air = pool.submit(
+            client.weather_api, AIR_QUALITY_URL, params=air_quality_params(locations)
         )
-        response = responses[0]
-        daily_df = df_daily(response)
-        hourly_df = df_hourly(response)
-        return daily_df, hourly_df
+        responses = client.weather_api(FORECAST_URL, params=forecast_params(locations))
+        try:
+            air_frames = [df_air(response) for response in air.result()]
+        except Exception:
+            # Air quality is extra; the forecast still renders without it.
+            air_frames = []
+
+    forecasts = [
+        {
+            "daily": df_daily(response),
+            "hourly": df_hourly(response),
+            "current": df_current(response),
+        }
+        for response in responses
+    ]
+    for forecast, air_frame in zip(forecasts, air_frames):
+        forecast["air"] = air_frame
+    return forecasts
+
 
-    daily_df, hourly_df = fetch_weather(lat, lon)
-    return daily_df, hourly_df
+def forecast_expiry(fetched_at: float) -> float:
+    # Open-Meteo publishes hourly, so a forecast goes stale at the top of the
+    # next hour even when SNAPSHOT_TTL hasn't run out.
+    next_hour = (fetched_at // 3600 + 1) * 3600
+    return min(fetched_at + SNAPSHOT_TTL, next_hour)
+
+
+def snapshot_path(location) -> Path:
+    lat, lon = location["latitude"], location["longitude"]
+    return CACHE_DIR / f"forecast_{lat:.4f}_{lon:.4f}.npz"
+
+
+def save_snapshot(path: Path, forecast: Forecast) -> float:
+    arrays = {
+        f"{block}.{name}": values
+        for block, frame in forecast.items()
+        for name, values in frame.items()
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    fetched_at = time.time()
+    with tmp.open("wb") as file:
+        np.savez(file, fetched_at=np.float64(fetched_at), **arrays)
+    tmp.replace(path)
+    return fetched_at
+
+
+def load_snapshot(path: Path) -> tuple[float, Forecast] | None:
+    try:
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in data.files}
+    except Exception:
+        return None
+    fetched_at = float(arrays.pop("fetched_at", 0.0))
+    forecast = {}
+    for key, values in arrays.items():
+        block, _, name = key.partition(".")
+        forecast.setdefault(block, {})[name] = values
+    # "air" is optional: the forecast is usable when air quality failed.
+    if not {"daily", "hourly", "current"} <= forecast.keys():
+        return None
+    return fetched_at, forecast
+
+
+def load_forecast(locations, offline=False):
+    paths = [snapshot_path(location) for location in locations]
+    snapshots = [load_snapshot(path) or (0.0, None) for path in paths]
+    fetched_at = min(fetched for fetched, _ in snapshots)
+    forecasts = [forecast for _, forecast in snapshots]
+    stale = time.time() >= forecast_expiry(fetched_at)
+    missing = any(forecast is None for forecast in forecasts)
+    if missing or (stale and not offline):
+        # One batched request refreshes every location at once.
+        try:
+            fresh = open_meteo(locations)
+        except Exception:
+            if missing:
+                raise
+            # Serve the stale forecasts rather than blanking the module.
+        else:
+            forecasts = fresh
+            fetched_at = min(map(save_snapshot, paths, fresh))
+    return forecasts, forecast_expiry(fetched_at)
+
+
+def icon_table(weather_icons=WEATHER_ICONS, fallback_icon=FALLBACK_ICON) -> np.ndarray:
+    # Rows are indexed by weather code; the extra last row is the fallback.
+    size = max(weather_icons) + 1
+    rows = [weather_icons.get(code, fallback_icon) for code in range(size)]
+    return np.array(rows + [fallback_icon], dtype=object)
+
+
+ICON_TABLE = icon_table()
 
 
 def add_daytime_flag(
-    hourly_df: pd.DataFrame, daily_df: pd.DataFrame, tz: str, step: int, metric
-) -> pd.DataFrame:
-    def is_daytime(row):
-        return row["sunrise"] <= row["date"] < row["sunset"]
-
-    def get_sun_string(current_time, sun_time, window_hours):
-        if pd.isna(sun_time):
-            return ""
-        window_end = current_time + pd.Timedelta(hours=window_hours)
-        if current_time <= sun_time < window_end:
-            return sun_time.strftime("%H:%M")
-        return ""
-
-    daily_df["sunrise"] = pd.to_datetime(
-        daily_df["sunrise"], unit="s", utc=True
-    ).dt.tz_convert(ZoneInfo(tz))
-    daily_df["sunset"] = pd.to_datetime(
-        daily_df["sunset"], unit="s", utc=True
-    ).dt.tz_convert(ZoneInfo(tz))
-    hourly_df["local_date"] = hourly_df["date"].dt.tz_convert(tz).dt.date
-    sun_times = daily_df.set_index(daily_df["date"].dt.date)[["sunrise", "sunset"]]
-    hourly_df = hourly_df.merge(
-        sun_times, left_on="local_date", right_index=True, how="left"
-    )
-    hourly_df["is_day"] = hourly_df.apply(is_daytime, axis=1)
-    hourly_df["sunrise_str"] = hourly_df.apply(
-        lambda r: get_sun_string(r["date"], r["sunrise"], step), axis=1
-    )
-    hourly_df["sunset_str"] = hourly_df.apply(
-        lambda r: get_sun_string(r["date"], r["sunset"], step), axis=1
-    )
-    units = "in"
+    hourly_df: Frame, daily_df: Frame, tz: str, step: int, metric
+) -> Frame:
+    zone = ZoneInfo(tz)
+    sunrise = col(daily_df, "sunrise").astype(np.int64)
+    sunset = col(daily_df, "sunset").astype(np.int64)
+
+    # Match every hour to its day's sunrise/sunset with a sorted search on
+    # the calendar date instead of a row-wise merge.
+    day_s = col(daily_df, "date")
+    day_keys = (day_s + local_offsets(day_s, zone)) // 86400
+    hour_s = col(hourly_df, "date")
+    hour_keys = (hour_s + local_offsets(hour_s, zone)) // 86400
+    idx = np.searchsorted(day_keys, hour_keys).clip(max=len(day_keys) - 1)
+    matched = day_keys[idx] == hour_keys
+    hour_sunrise = sunrise[idx]
+    hour_sunset = sunset[idx]
+    hourly_df["is_day"] = matched & (hour_sunrise <= hour_s) & (hour_s < hour_sunset)
+
+    window_end = hour_s + step * 3600
+    for name, sun_s, day_s in (
+        ("sunrise_str", hour_sunrise, sunrise),
+        ("sunset_str", hour_sunset, sunset),
+    ):
+        day_strings = clock_strings(day_s, zone)
+        in_window = matched & (hour_s <= sun_s) & (sun_s < window_end)
+        sun_strings = np.ma.masked_array(day_strings[idx], mask=~in_window)
+        hourly_df[name] = sun_strings.filled("")
+
     if metric:
-        units = "cm"
-        hourly_df["temperature_2m"] = (hourly_df["temperature_2m"] - 32) * 5 / 9
-        daily_df["temperature_2m_max"] = (daily_df["temperature_2m_max"] - 32) * 5 / 9
-        daily_df["temperature_2m_min"] = (daily_df["temperature_2m_min"] - 32) * 5 / 9
-        hourly_df["precipitation"] = hourly_df["precipitation"] * 2.54
-        daily_df["precipitation_sum"] = daily_df["precipitation_sum"] * 2.54
-    hourly_df["units"] = units
-    daily_df["units"] = units
+        hourly_df["temperature_2m"] = (col(hourly_df, "temperature_2m") - 32) * 5 / 9
+        daily_df["temperature_2m_max"] = (
+            (col(daily_df, "temperature_2m_max") - 32) * 5 / 9
+        )
+        daily_df["temperature_2m_min"] = (
+            (col(daily_df, "temperature_2m_min") - 32) * 5 / 9
+        )
+        hourly_df["precipitation"] = col(hourly_df, "precipitation") * 2.54
+        daily_df["precipitation_sum"] = col(daily_df, "precipitation_sum") * 2.54
     return hourly_df
 
 
 def map_icons(
-    df: pd.DataFrame,
+    df: Frame,
     is_hourly: bool = False,
-    weather_icons=WEATHER_ICONS,
-    fallback_icon=FALLBACK_ICON,
-) -> pd.DataFrame:
-    def pick_icon_and_description(row):
-        weather_code = int(row["weather_code"])
-        _, night_icon, day_icon = weather_icons.get(weather_code, fallback_icon)
-        description = weather_icons.get(weather_code, fallback_icon)[0]
-        if is_hourly and not row.get("is_day", True):
-            return day_icon, description
-        return night_icon, description
-
-    df[["icon", "description"]] = df.apply(
-        pick_icon_and_description, axis=1, result_type="expand"
-    )
+    table: np.ndarray = ICON_TABLE,
+) -> Frame:
+    codes = col(df, "weather_code").astype(np.float64)
+    fallback = len(table) - 1
+    known = (codes >= 0) & (codes < fallback)
+    rows = table[np.where(known, codes, fallback).astype(np.intp)]
+    night = np.zeros(len(codes), dtype=bool)
+    if is_hourly and "is_day" in df:
+        night = ~col(df, "is_day").astype(bool)
+    df["icon"] = np.where(night, rows[:, 2], rows[:, 1])
+    df["description"] = rows[:, 0]
     return df
 
 
-@dataclass
-class WeatherEntry:
-    label: str
-    icon: str
-    temp: float
-    units: str
-    units_in_cm: str
-    sunset_str: str | None = None
-    sunrise_str: str | None = None
-    temp_low: float | None = None
-    precip_prob: int = 0
-    precipitation: float = 0.0
-
-    def format(self) -> str:
-        today = pd.Timestamp.now().strftime("%m-%d")
-        label = self.label
-        if self.label == today:
-            label = "Today"
-        precip_prob = f"{self.precip_prob}%" if self.precip_prob > 0 else ""
-
-        precip_sum = ""
-        if 0.01 <= self.precipitation < 0.1:
-            if round(self.precipitation, 2) == 0.1:
-                precip = f"{round(self.precipitation, 1)}"
-                precip_sum = f"({precip}{self.units_in_cm})"
-            else:
-                precip = f"{round(self.precipitation, 2)}".lstrip("0")
-                precip_sum = f"({precip}{self.units_in_cm})"
-        elif 0.1 < self.precipitation:
-            precip = f"{round(self.precipitation, 1)}"
-            precip_sum = f"({precip}{self.units_in_cm})"
-
-        temp_low = ""
-        if self.temp_low:
-            temp_low = round(self.temp_low)
-            if self.temp_low > 0.01:
-                temp_low = round(self.temp_low)
-        daily_temp = f"{round(self.temp)}/{temp_low}"
-
-        sun_icon = ""
-        sun_time = ""
-        if self.sunrise_str:
-            sun_icon = "󰖜"
-            sun_time = f"{self.sunrise_str}"
-        if self.sunset_str:
-            sun_icon = "󰖛"
-            sun_time = f"{self.sunset_str}".rjust(4)
-
-        rain_icon = "󰖌" if self.precip_prob > 0 else ""
-
-        is_hourly = ":" in self.label
-        if is_hourly:
-            return (
-                f"{self.label:<5}"
-                f"<span size='21pt'>{self.icon.rjust(2)}</span>"
-                f"{str(round(self.temp)).rjust(5)}<span size='17pt'></span>{self.units}"
-                f"<span size='14pt'>{rain_icon.rjust(3)}</span>{precip_prob.rjust(4)}{precip_sum.rjust(7)}"
-                f"<span size='20pt'>{sun_icon.rjust(2)} </span>{sun_time.rjust(4)}"
-            )
-        else:
-            rain_icon = rain_icon.rjust(4)
-            return (
-                f"{label:<5}"
-                f"<span size='23pt'>{self.icon.rjust(2)}</span>"
-                f"{daily_temp.rjust(8)}<span size='17pt'></span>{self.units}"
-                f"<span size='14pt'>{rain_icon.rjust(6)}</span>{precip_prob.rjust(5)}{precip_sum.rjust(9)}"
-            )
+RAIN_ICON = "󰖌"
+SUNRISE_ICON = "󰖜"
+SUNSET_ICON = "󰖛"
+TEMP_ICON = ""
+
+
+def span(size: str, text: str) -> str:
+    return f"<span size='{size}'>{text}</span>"
+
+
+# Fixed-width markup fragments, picked per row instead of formatted per row.
+HOURLY_RAIN = tuple(span("14pt", icon.rjust(3)) for icon in ("", RAIN_ICON))
+DAILY_RAIN = tuple(span("14pt", icon.rjust(6)) for icon in ("", RAIN_ICON))
+SUN_SPANS = tuple(
+    span("20pt", f"{icon.rjust(2)} ") for icon in ("", SUNRISE_ICON, SUNSET_ICON)
+)
+
+
+def round_column(values: np.ndarray) -> list[int]:
+    return np.rint(values.astype(np.float64)).astype(np.int64).tolist()
+
 
+def precip_text(amount: float, units: str) -> str:
+    if 0.01 <= amount < 0.1:
+        if round(amount, 2) == 0.1:
+            return f"({round(amount, 1)}{units})"
+        precip = f"{round(amount, 2)}".lstrip("0")
+        return f"({precip}{units})"
+    if 0.1 < amount:
+        return f"({round(amount, 1)}{units})"
+    return ""
 
-def today_formatted() -> str:
-    t = pd.Timestamp.now()
+
+def precip_columns(probs: np.ndarray, amounts: np.ndarray, units: str):
+    probs = probs.astype(np.int64).tolist()
+    prob_text = [f"{prob}%" if prob > 0 else "" for prob in probs]
+    amount_text = [precip_text(amount, units) for amount in amounts.tolist()]
+    return [prob > 0 for prob in probs], prob_text, amount_text
+
+
+def hourly_lines(hourly: Frame, labels, units: str, units_in_cm: str) -> list[str]:
+    rain, prob_text, amount_text = precip_columns(
+        col(hourly, "precipitation_probability"),
+        col(hourly, "precipitation"),
+        units_in_cm,
+    )
+    temp_span = span("17pt", TEMP_ICON) + units
+    sun = [
+        (SUN_SPANS[2], sunset) if sunset else (SUN_SPANS[bool(sunrise)], sunrise)
+        for sunrise, sunset in zip(
+            col(hourly, "sunrise_str").tolist(), col(hourly, "sunset_str").tolist()
+        )
+    ]
+    return [
+        f"{label:<5}<span size='21pt'>{icon:>2}</span>{temp:>5}{temp_span}"
+        f"{HOURLY_RAIN[wet]}{prob:>4}{amount:>7}{sun_span}{sun_time:>4}"
+        for label, icon, temp, wet, prob, amount, (sun_span, sun_time) in zip(
+            labels.tolist(),
+            col(hourly, "icon").tolist(),
+            round_column(col(hourly, "temperature_2m")),
+            rain,
+            prob_text,
+            amount_text,
+            sun,
+        )
+    ]
+
+
+def daily_lines(daily: Frame, labels, units: str, units_in_cm: str) -> list[str]:
+    rain, prob_text, amount_text = precip_columns(
+        col(daily, "precipitation_probability_max"),
+        col(daily, "precipitation_sum"),
+        units_in_cm,
+    )
+    temp_span = span("17pt", TEMP_ICON) + units
+    low = col(daily, "temperature_2m_min")
+    temps = [
+        f"{high}/{low if nonzero else ''}"
+        for high, low, nonzero in zip(
+            round_column(col(daily, "temperature_2m_max")),
+            round_column(low),
+            (low != 0).tolist(),
+        )
+    ]
+    return [
+        f"{label:<5}<span size='23pt'>{icon:>2}</span>{temp:>8}{temp_span}"
+        f"{DAILY_RAIN[wet]}{prob:>5}{amount:>9}"
+        for label, icon, temp, wet, prob, amount in zip(
+            labels,
+            col(daily, "icon").tolist(),
+            temps,
+            rain,
+            prob_text,
+            amount_text,
+        )
+    ]
+
+
+def air_text(air: Frame) -> str:
+    values = {name: float(col(air, name)[0]) for name in AIR_VARIABLES}
+    parts = []
+    aqi = values["us_aqi"]
+    if not np.isnan(aqi):
+        level = next(
+            (label for limit, label in AQI_LEVELS if aqi <= limit), "Hazardous"
+        )
+        parts.append(f"AQI {aqi:.0f} {level}")
+    if not np.isnan(values["uv_index"]):
+        parts.append(f"UV {values['uv_index']:.0f}")
+    pollen = [
+        f"{name.removesuffix('_pollen')} {value:.0f}"
+        for name, value in values.items()
+        if name.endswith("_pollen") and value > 0
+    ]
+    if pollen:
+        parts.append("Pollen " + ", ".join(pollen))
+    return "   ".join(parts)
+
+
+def today_formatted(t: datetime) -> str:
     day_suffix = {1: "st", 2: "nd", 3: "rd"}.get(t.day % 10, "th")
     if 10 <= t.day % 100 <= 20:
         day_suffix = "th"
     return t.strftime(f"%a, %b {t.day}{day_suffix}, %Y")
 
 
-def build_tooltip(daily_df, hourly_df, my_zone: str, celsius, hourly_step=2):
-    def proc_entries(entries):
-        return "\n".join([entry.format() for entry in entries])
-
+def build_tooltip(
+    daily_df,
+    hourly_df,
+    my_zone: str,
+    celsius,
+    hourly_step=2,
+    now: float | None = None,
+    air: str = "",
+):
     unit_str = "C" if celsius else "F"
-    t = pd.Timestamp.now(ZoneInfo(my_zone))
+    units_in_cm = "cm" if celsius else "in"
+    zone = ZoneInfo(my_zone)
+    now = time.time() if now is None else now
+    t = datetime.fromtimestamp(now, zone)
     current_time = t.replace(minute=0, second=0, microsecond=0)
-    time_24h_later = current_time + pd.Timedelta(hours=24)  # 24 hours later
+    window_start = int(current_time.timestamp())
+    window_end = window_start + FORECAST_HOURS * 3600
     current_time_str = t.strftime("%H:%M")
-    hourly_df["date"] = hourly_df["date"].dt.tz_convert(ZoneInfo(my_zone))
-    hourly_entries = [
-        WeatherEntry(
-            label=row["date"].strftime("%H:%M"),
-            icon=row["icon"],
-            temp=row["temperature_2m"],
-            sunrise_str=row["sunrise_str"],
-            sunset_str=row["sunset_str"],
-            units=unit_str,
-            units_in_cm=row["units"],
-            precip_prob=int(row.get("precipitation_probability", 0)),
-            precipitation=row.get("precipitation", 0.0),
-        )
-        for i, (_, row) in enumerate(hourly_df.iterrows())
-        if current_time <= row["date"] < time_24h_later
-        and (row["date"].hour - current_time.hour) % hourly_step == 0
-    ]
-    daily_entries = [
-        WeatherEntry(
-            label=row["date"].strftime("%m-%d"),
-            icon=row["icon"],
-            units_in_cm=row["units"],
-            temp=row["temperature_2m_max"],
-            temp_low=row["temperature_2m_min"],
-            units=unit_str,
-            precip_prob=int(row.get("precipitation_probability_max", 0)),
-            precipitation=row.get("precipitation_sum", 0.0),
+    hour_s = col(hourly_df, "date")
+    local_hours = (hour_s + local_offsets(hour_s, zone)) % 86400 // 3600
+    visible = np.flatnonzero(
+        (window_start <= hour_s)
+        & (hour_s < window_end)
+        & ((local_hours - current_time.hour) % hourly_step == 0)
+    )
+    window = {
+        name: col(hourly_df, name)[visible]
+        for name in (
+            "icon",
+            "temperature_2m",
+            "precipitation_probability",
+            "precipitation",
+            "sunrise_str",
+            "sunset_str",
         )
-        for _, row in daily_df.iterrows()
+    }
+    hourly_labels = clock_strings(hour_s[visible], zone)
+    today = t.strftime("%m-%d")
+    daily_labels = [
+        "Today" if label == today else label
+        for label in date_strings(col(daily_df, "date"), zone)
     ]
-    formatted_date = today_formatted()
+    hourly_text = "\n".join(hourly_lines(window, hourly_labels, unit_str, units_in_cm))
+    daily_text = "\n".join(daily_lines(daily_df, daily_labels, unit_str, units_in_cm))
+    formatted_date = today_formatted(t)
     icon_size = 20
+    air_line = f"<span size='13pt'>{air}</span>\n" if air else ""
     return (
         f"<span size='{icon_size}pt'>󰨳</span><span size='13pt'>  {formatted_date}</span>\n"
-        "─────────────────────────────────────────\n"
-        + f"{proc_entries(daily_entries)}\n"
+        + air_line
+        + "─────────────────────────────────────────\n"
+        + f"{daily_text}\n"
         + f"\n<span size='{icon_size}pt'></span><span size='13pt'>  {current_time_str}</span>\n"
         "─────────────────────────────────────────\n"
-        + f"{proc_entries(hourly_entries)}"
+        f"{hourly_text}"
     )
 
 
@@ -392,54 +619,110 @@ def parse_args():
         action="store_true",
         help="Use metric units (Celsius, cm, etc.)",
     )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Stay resident and print on change; SIGUSR1 toggles units",
+    )
     args = parser.parse_args()
-    if args.metric:
-        if CACHE_FILE.exists():
-            CACHE_FILE.unlink()
-            METRIC = False
-        else:
-            with CACHE_FILE.open("w") as file:
-                file.write("True")
-            METRIC = True
+    if args.metric and not args.daemon:
+        METRIC = save_metric(not CACHE_FILE.exists())
     else:
-        if CACHE_FILE.exists():
-            METRIC = True
-        else:
-            METRIC = False
+        METRIC = CACHE_FILE.exists()
 
-    return METRIC
+    return METRIC, args
 
 
-def main():
-    METRIC = parse_args()
-    daily_df, hourly_df = open_meteo(
-        lat=LATITUDE,
-        lon=LONGITUDE,
-    )
+def save_metric(metric: bool) -> bool:
+    if metric:
+        CACHE_FILE.write_text("True")
+    else:
+        CACHE_FILE.unlink(missing_ok=True)
+    return metric
+
+
+def location_tooltip(location, forecast: Forecast, metric, now=None) -> str:
+    # Work on copies so the loaded forecast can be re-rendered in either unit.
+    daily_df = forecast["daily"].copy()
+    hourly_df = forecast["hourly"].copy()
     # print(f"{hourly_df.head(48)}")
     hourly_df = add_daytime_flag(
         hourly_df,
         daily_df,
-        tz=TIMEZONE,
+        tz=location["timezone"],
         step=HOURLY_STEP,
-        metric=METRIC,
+        metric=metric,
     )
     hourly_df = map_icons(hourly_df, is_hourly=True)
     daily_df = map_icons(daily_df, is_hourly=False)
-    tooltip = build_tooltip(
+    return build_tooltip(
         daily_df,
         hourly_df,
-        my_zone=TIMEZONE,
-        celsius=METRIC,
+        my_zone=location["timezone"],
+        celsius=metric,
         hourly_step=HOURLY_STEP,
+        now=now,
+        air=air_text(forecast["air"]) if "air" in forecast else "",
     )
-    current = hourly_df.iloc[0]
-    output = {
-        "text": current.icon,
+
+
+def render(
+    forecasts: list[Forecast], metric, now: float | None = None, locations=LOCATIONS
+) -> dict:
+    tooltips = [
+        location_tooltip(location, forecast, metric, now)
+        for location, forecast in zip(locations, forecasts)
+    ]
+    if len(tooltips) > 1:
+        tooltips = [
+            f"<span size='15pt'><b>{location['name']}</b></span>\n{tooltip}"
+            for location, tooltip in zip(locations, tooltips)
+        ]
+    tooltip = "\n\n".join(tooltips)
+    current = map_icons(forecasts[0]["current"].copy(), is_hourly=True)
+    return {
+        "text": col(current, "icon")[0],
         "tooltip": tooltip,
-        "class": current.description,
+        "class": col(current, "description")[0],
     }
-    print(json.dumps(output, ensure_ascii=False))
+
+
+def run_daemon(metric):
+    # SIGUSR1 is only ever taken synchronously through sigtimedwait, so a
+    # unit toggle wakes the loop immediately instead of spawning a new run:
+    #   pkill -USR1 -f 'weather/main.py --daemon'
+    signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGUSR1})
+    forecasts = None
+    refresh_at = 0.0
+    last_output = None
+    while True:
+        now = time.time()
+        if now >= refresh_at:
+            try:
+                forecasts, expires_at = load_forecast(LOCATIONS)
+                refresh_at = max(expires_at, now + FETCH_RETRY)
+            except Exception:
+                refresh_at = now + FETCH_RETRY
+        if forecasts:
+            output = json.dumps(render(forecasts, metric), ensure_ascii=False)
+            if output != last_output:
+                print(output, flush=True)
+                last_output = output
+        # Re-render on the wall-clock grid so the hourly window rolls forward
+        # from memory; network work only happens once refresh_at is reached.
+        next_render = (now // RENDER_INTERVAL + 1) * RENDER_INTERVAL
+        timeout = max(0.0, min(next_render, refresh_at) - time.time())
+        if signal.sigtimedwait([signal.SIGUSR1], timeout) is not None:
+            metric = save_metric(not metric)
+
+
+def main():
+    METRIC, args = parse_args()
+    if args.daemon:
+        run_daemon(METRIC)
+        return
+    forecasts, _ = load_forecast(LOCATIONS, offline=args.metric)
+    print(json.dumps(render(forecasts, METRIC), ensure_ascii=False))
 
 
 if __name__ == "__main__":
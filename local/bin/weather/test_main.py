@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+# The tooltip markup against fixtures/render.json, rendered offline from the
+# recorded forecast. Regenerate it with `bench.py --update-golden` only when
+# a markup change is intended.
+import json
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import bench
+
+
+class RenderGoldenTest(unittest.TestCase):
+    maxDiff = None
+
+    def test_tooltip_matches_golden(self):
+        bodies = {
+            bench.weather.FORECAST_URL: bench.FIXTURE.read_bytes(),
+            bench.weather.AIR_QUALITY_URL: bench.AIR_FIXTURE.read_bytes(),
+        }
+        expected = json.loads(bench.GOLDEN.read_text())
+        tooltips = bench.golden_tooltips(bodies)
+        self.assertEqual(tooltips.keys(), expected.keys())
+        for now, by_units in expected.items():
+            for units, tooltip in by_units.items():
+                with self.subTest(now=now, units=units):
+                    self.assertEqual(tooltips[now][units], tooltip)
+
+
+if __name__ == "__main__":
+    unittest.main()